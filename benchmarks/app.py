@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+import sys
+from pathlib import Path
+from typing import Tuple
+from types import ModuleType
+from config import settings
+
+
+def import_app(path: Path) -> Tuple[ModuleType, ModuleType]:
+    """Imports main and movies for an in-process benchmark of the API
+        Importing movies builds its storage on settings.database_file, the
+        first import opens the benchmark catalog at path instead of
+        ./movies.json and closes that database (its flusher thread and file
+        handle), callers install their own in movies.db
+        Returns (main, movies)
+    """
+    first_import = "movies" not in sys.modules
+    database_file, settings.database_file = settings.database_file, str(path)
+    try:
+        import main
+        import movies
+    finally:
+        settings.database_file = database_file
+    if first_import:
+        movies.db.close()
+    return main, movies
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Load test of the API in-process: concurrent clients per endpoint,
+    reports p50/p99 latency and throughput
+
+    python -m benchmarks.bench_api [count] [requests] [concurrency]
+"""
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+import httpx
+from benchmarks.app import import_app
+from benchmarks.synthetic import FIRST_NAMES, GENRES, LAST_NAMES, TITLE_WORDS, generate_movie, write_catalog
+from benchmarks.timing import summarize
+from config import settings
+from database import MovieDatabase
+
+
+# Endpoint name -> function returning (method, url, json body) for a random request
+def endpoints(rng: random.Random) -> Dict[str, Callable[[], tuple]]:
+    return {
+        "list": lambda: ("GET", "/api/v1/movies?limit=50", None),
+        "by_year": lambda: ("GET", f"/api/v1/movies/{rng.randint(1950, 2025)}?limit=50", None),
+        "by_director": lambda: ("GET", f"/api/v1/movies/director/{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}?limit=50", None),
+        "by_genre": lambda: ("GET", f"/api/v1/movies/genre/{rng.choice(GENRES)}?limit=50", None),
+        "search": lambda: ("GET", f"/api/v1/movies/search/{rng.choice(TITLE_WORDS)}?limit=50", None),
+        "query": lambda: ("GET", f"/api/v1/movies/query?genre={rng.choice(GENRES)}&rating_min={rng.randint(1, 9)}&limit=50", None),
+        "stats": lambda: ("GET", "/api/v1/movies/stats?group_by=genre", None),
+        "create": lambda: ("POST", "/api/v1/movies", generate_movie(rng)),
+    }
+
+
+async def load(client: httpx.AsyncClient, request: Callable[[], tuple], requests: int, concurrency: int) -> dict:
+    """Sends requests requests from concurrency clients, returns the summary"""
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            method, url, body = request()
+            began = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - began)
+            errors += response.status_code >= 500
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {**summarize(latencies, time.perf_counter() - start), "errors": errors}
+
+
+async def run(app, count: int, requests: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    results = {"count": count, "requests": requests, "concurrency": concurrency,
+               "response_cache": settings.response_cache_enabled, "fast_responses": settings.fast_responses}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, request in endpoints(rng).items():
+            method, url, body = request()
+            await client.request(method, url, json=body) # warm up
+            results[name] = await load(client, request, requests, concurrency)
+    return results
+
+
+def main_bench(count: int, requests: int = 500, concurrency: int = 16, seed: int = 7) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_catalog(Path(tmp) / "movies.json", count)
+        main, movies = import_app(path)
+        previous, movies.db = movies.db, MovieDatabase(file_path=path, group_commit=settings.group_commit,
+                                                       search_fields=settings.search_fields)
+        try:
+            return asyncio.run(run(main.app, count, requests, concurrency, seed))
+        finally:
+            movies.db.close()
+            movies.db = previous
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count, requests, concurrency = (args + [100_000, 500, 16][len(args):])[:3]
+    print(json.dumps(main_bench(count, requests, concurrency), indent=2))
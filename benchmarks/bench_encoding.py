@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Compares the bytes sent and the throughput of a list endpoint in each
+    representation (JSON, gzip, br, MessagePack), with and without the
+    response cache, and the cost of the JSON encoders
+
+    python -m benchmarks.bench_encoding [count] [limit] [requests]
+"""
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from fastapi.testclient import TestClient
+from benchmarks.app import import_app
+from benchmarks.synthetic import write_catalog
+from benchmarks.timing import time_calls
+from config import settings
+from database import MovieDatabase
+from records import dumps_json
+import negotiation
+
+
+# Representation name -> request headers, those needing a missing package are skipped
+REPRESENTATIONS = {
+    "json": {"Accept-Encoding": "identity"},
+    "json_gzip": {"Accept-Encoding": "gzip"},
+    "json_br": {"Accept-Encoding": "br"},
+    "msgpack": {"Accept": "application/msgpack", "Accept-Encoding": "identity"},
+    "msgpack_gzip": {"Accept": "application/msgpack", "Accept-Encoding": "gzip"},
+}
+
+
+def fetch(client: TestClient, url: str, headers: dict) -> int:
+    """GETs url, returns the bytes received (still compressed)"""
+    with client.stream("GET", url, headers=headers) as response:
+        return sum(len(chunk) for chunk in response.iter_raw())
+
+
+def requests_per_second(client: TestClient, url: str, headers: dict, requests: int) -> float:
+    fetch(client, url, headers) # warm up
+    start = time.perf_counter()
+    for _ in range(requests):
+        fetch(client, url, headers)
+    return requests / (time.perf_counter() - start)
+
+
+def main_bench(count: int, limit: int, requests: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_catalog(Path(tmp) / "movies.json", count)
+        main, movies = import_app(path)
+        previous, movies.db = movies.db, MovieDatabase(file_path=path, journal=False)
+        cache_enabled = settings.response_cache_enabled
+        try:
+            client = TestClient(main.app)
+            url = f"/api/v1/movies?limit={limit}"
+            results = {"count": count, "limit": limit, "requests": requests,
+                       "installed": {"orjson": negotiation.orjson is not None, "msgpack": negotiation.msgpack is not None,
+                                     "brotli": negotiation.brotli is not None}}
+            # encoder cost alone, on the page as FastAPI hands it to the response
+            page = json.loads(client.get(url, headers=REPRESENTATIONS["json"]).content)
+            results["encode_json_module"] = time_calls(
+                lambda i: json.dumps(page, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), requests)
+            results["encode_dumps_json"] = time_calls(lambda i: dumps_json(page), requests)
+            for name, headers in REPRESENTATIONS.items():
+                if (("br" in name and "br" not in main.negotiator.encodings)
+                        or ("msgpack" in name and not main.negotiator.msgpack)):
+                    continue
+                row = results[name] = {"bytes": fetch(client, url, headers)}
+                for cached in (False, True):
+                    settings.response_cache_enabled = cached
+                    main.response_cache.clear()
+                    row["cached_rps" if cached else "rps"] = round(requests_per_second(client, url, headers, requests), 1)
+            return results
+        finally:
+            settings.response_cache_enabled = cache_enabled
+            movies.db.close()
+            movies.db = previous
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count, limit, requests = (args + [100_000, 200, 200][len(args):])[:3]
+    print(json.dumps(main_bench(count, limit, requests), indent=2))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Compares the memory of the compact MovieRecord store against plain dicts
+
+    python -m benchmarks.bench_memory [count]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+from benchmarks.synthetic import iter_movies
+from records import MovieRecord
+
+
+def measure(build) -> int:
+    """Returns the bytes still allocated by the structure build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    store = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return size
+
+
+def main(count: int) -> dict:
+    # decoding from JSON text gives every dict its own strings, like load_data
+    text = [json.dumps(movie) for movie in iter_movies(count)]
+    dict_bytes = measure(lambda: {movie["id"]: movie for movie in map(json.loads, text)})
+    record_bytes = measure(lambda: {movie["id"]: MovieRecord.from_dict(movie) for movie in map(json.loads, text)})
+    return {
+        "count": count,
+        "dict_bytes_per_movie": round(dict_bytes / count, 1),
+        "record_bytes_per_movie": round(record_bytes / count, 1),
+        "saving": round(1 - record_bytes / dict_bytes, 3),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000), indent=2))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Compares list endpoint throughput with and without fast_responses
+
+    python -m benchmarks.bench_serialization [count] [limit] [requests]
+"""
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from fastapi.testclient import TestClient
+from benchmarks.app import import_app
+from benchmarks.synthetic import generate_movies
+from config import settings
+from database import MovieDatabase
+
+
+def requests_per_second(client: TestClient, url: str, requests: int) -> float:
+    """Sends requests GETs to url, returns the throughput"""
+    client.get(url) # warm up (and fill the per-record fragments)
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(url)
+    return requests / (time.perf_counter() - start)
+
+
+def main_bench(count: int, limit: int, requests: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "movies.json"
+        path.write_text(json.dumps({"movies": generate_movies(count), "next_id": count + 1}), encoding="utf-8")
+        main, movies = import_app(path)
+        previous, movies.db = movies.db, MovieDatabase(file_path=path, journal=False)
+        cache_enabled, fast_responses = settings.response_cache_enabled, settings.fast_responses
+        try:
+            # measure serialization, not the response cache
+            settings.response_cache_enabled = False
+            client = TestClient(main.app)
+            results = {"count": count, "limit": limit, "requests": requests}
+            for name, url in (("list", f"/api/v1/movies?limit={limit}"),
+                              ("list_by_rating", f"/api/v1/movies?limit={limit}&sort=-rating"),
+                              ("query", f"/api/v1/movies/query?rating_min=5&limit={limit}")):
+                settings.fast_responses = False
+                model_body = client.get(url).content
+                model_rps = requests_per_second(client, url, requests)
+                settings.fast_responses = True
+                fast_body = client.get(url).content
+                fast_rps = requests_per_second(client, url, requests)
+                results[name] = {
+                    "model_rps": round(model_rps, 1),
+                    "fast_rps": round(fast_rps, 1),
+                    "speedup": round(fast_rps / model_rps, 2),
+                    "same_body": model_body == fast_body,
+                }
+            return results
+        finally:
+            settings.response_cache_enabled, settings.fast_responses = cache_enabled, fast_responses
+            movies.db.close()
+            movies.db = previous
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count, limit, requests = (args + [100_000, 1000, 200][len(args):])[:3]
+    print(json.dumps(main_bench(count, limit, requests), indent=2))
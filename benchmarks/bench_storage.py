@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of the MovieDatabase methods on a synthetic catalog
+
+    python -m benchmarks.bench_storage [count] [calls]
+"""
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import FIRST_NAMES, GENRES, LAST_NAMES, TITLE_WORDS, generate_movie, write_catalog
+from benchmarks.timing import time_calls
+from database import MovieDatabase
+
+
+def main_bench(count: int, calls: int = 200, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    # loading and saving rewrite the whole catalog, a few calls are enough
+    heavy_calls = 3 if count >= 100_000 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_catalog(Path(tmp) / "movies.json", count)
+        start = time.perf_counter()
+        db = MovieDatabase(file_path=path, group_commit=False)
+        results = {"count": count, "calls": calls, "open_s": round(time.perf_counter() - start, 4)}
+        words = [word.lower() for word in TITLE_WORDS]
+        directors = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+        ops = {
+            "get_movie": lambda i: db.get_movie(rng.randint(1, count)),
+            "search_movies": lambda i: db.search_movies(rng.choice(words)),
+            "search_movies_fuzzy": lambda i: db.search_movies(rng.choice(words)[:-1] + "x", fuzzy=True),
+            "get_movie_by_year": lambda i: db.get_movie_by_year(rng.randint(1950, 2025)),
+            "get_movie_by_director": lambda i: db.get_movie_by_director(rng.choice(directors)),
+            "get_movies_by_genre": lambda i: db.get_movies_by_genre(rng.choice(GENRES)),
+            "add_movie": lambda i: db.add_movie(generate_movie(rng)),
+        }
+        for name, op in ops.items():
+            # the by_* lookups return a 1/N slice of the catalog, bound their cost
+            results[name] = time_calls(op, calls if count < 1_000_000 or name in ("get_movie", "add_movie") else 10)
+        results["save_data"] = time_calls(lambda i: db.save_data(), heavy_calls)
+        results["load_data"] = time_calls(lambda i: db.load_data(), heavy_calls)
+        db.close()
+        return results
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count, calls = (args + [100_000, 200][len(args):])[:2]
+    print(json.dumps(main_bench(count, calls), indent=2))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Runs the storage and API benchmarks on synthetic catalogs and writes
+    the results as JSON, optionally compared against a previous run
+
+    python -m benchmarks.run --sizes 1k,100k --output results.json
+    python -m benchmarks.run --sizes 1k,100k --baseline results.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from benchmarks import bench_api, bench_storage
+from benchmarks.synthetic import SIZES
+
+
+# Lower is better for latencies, higher for throughput
+LATENCY_KEYS = ("p50_ms", "p99_ms")
+THROUGHPUT_KEYS = ("ops_per_s",)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns one row per metric present in both runs, with the change
+        relative to the baseline (positive = slower) and a regression flag
+    """
+    rows = []
+    for size, suites in results["runs"].items():
+        for suite, operations in suites.items():
+            for name, metrics in operations.items():
+                old = baseline.get("runs", {}).get(size, {}).get(suite, {}).get(name)
+                if not isinstance(metrics, dict) or not isinstance(old, dict):
+                    continue
+                for key in LATENCY_KEYS + THROUGHPUT_KEYS:
+                    if not old.get(key) or key not in metrics:
+                        continue
+                    change = metrics[key] / old[key] - 1
+                    if key in THROUGHPUT_KEYS:
+                        change = -change
+                    rows.append({"size": size, "suite": suite, "operation": name, "metric": key,
+                                 "baseline": old[key], "current": metrics[key], "change": round(change, 4),
+                                 "regression": change > threshold})
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,100k", help=f"Comma separated catalog sizes among {', '.join(SIZES)}")
+    parser.add_argument("--suites", default="storage,api", help="Comma separated suites: storage, api")
+    parser.add_argument("--calls", type=int, default=200, help="Calls per storage method")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per API endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent API clients")
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="Compare against the results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as regression")
+    args = parser.parse_args(argv)
+    sizes = [size.strip().lower() for size in args.sizes.split(",")]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"Unknown sizes {', '.join(unknown)}, valid sizes: {', '.join(SIZES)}")
+    suites = [suite.strip() for suite in args.suites.split(",")]
+    results = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+               "platform": platform.platform(), "runs": {}}
+    for size in sizes:
+        run = results["runs"][size] = {}
+        if "storage" in suites:
+            print(f"[benchmarks.run] storage {size}", file=sys.stderr)
+            run["storage"] = bench_storage.main_bench(SIZES[size], args.calls)
+        if "api" in suites:
+            print(f"[benchmarks.run] api {size}", file=sys.stderr)
+            run["api"] = bench_api.main_bench(SIZES[size], args.requests, args.concurrency)
+    regressions = []
+    if args.baseline:
+        results["comparison"] = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+        regressions = [row for row in results["comparison"] if row["regression"]]
+        for row in regressions:
+            print(f"[benchmarks.run] regression {row['size']} {row['suite']}.{row['operation']} {row['metric']}:"
+                  f" {row['baseline']} -> {row['current']} ({row['change']:+.1%})", file=sys.stderr)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
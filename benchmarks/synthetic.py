@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import json
+import random
+from pathlib import Path
+from typing import Iterator, List
+
+
+# Vocabulary used to build synthetic catalogs in the movies.json schema
+GENRES = ["Scifi", "Drama", "Comedy", "Action", "Horror", "Romance", "Fantasy", "Thriller", "Animation", "Documentary"]
+TITLE_WORDS = ["Star", "Night", "Lost", "City", "Dream", "Return", "Shadow", "Galaxy", "Polar", "Storm",
+               "Guardians", "Final", "Destination", "Grown", "Ups", "Whiplash", "Inception", "Empire",
+               "River", "Fire", "Ghost", "Summer", "Winter", "Secret", "Iron", "Golden", "Last", "Journey"]
+FIRST_NAMES = ["Christopher", "Anthony", "Greta", "Denis", "Sofia", "Adam", "Robin", "Kathryn", "Bong", "Ava"]
+LAST_NAMES = ["Nolan", "Russo", "Gerwig", "Villeneuve", "Coppola", "Sandler", "Williams", "Bigelow", "Joon-ho", "DuVernay"]
+
+
+def generate_movie(rng: random.Random) -> dict:
+    """Returns one random movie without id"""
+    return {
+        "title": " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3))) + (f" {rng.randint(2, 5)}" if rng.random() < 0.1 else ""),
+        "director": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "year": rng.randint(1950, 2025),
+        "genre": rng.choice(GENRES),
+        "duration": rng.randint(70, 200),
+        "rating": round(rng.uniform(1, 10), 1),
+        "synopsis": "Non Provided",
+        "price": round(rng.uniform(0, 20), 2),
+        "is_watched": rng.random() < 0.4,
+    }
+
+
+def iter_movies(count: int, seed: int = 42, with_ids: bool = True) -> Iterator[dict]:
+    """Yields count synthetic movies, reproducible for a given seed"""
+    rng = random.Random(seed)
+    for movie_id in range(1, count + 1):
+        movie = generate_movie(rng)
+        yield {"id": movie_id, **movie} if with_ids else movie
+
+
+def generate_movies(count: int, seed: int = 42, with_ids: bool = True) -> List[dict]:
+    """Returns count synthetic movies"""
+    return list(iter_movies(count, seed, with_ids))
+
+
+# Catalog sizes of the benchmark suite
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def write_catalog(path: Path, count: int, seed: int = 42) -> Path:
+    """Writes a movies.json of count synthetic movies, streamed so the
+        1M catalog is never held as one string
+    """
+    with Path(path).open("w", encoding="utf-8") as data:
+        data.write('{"movies": [')
+        for movie in iter_movies(count, seed):
+            data.write(("," if movie["id"] > 1 else "") + json.dumps(movie))
+        data.write(f'], "next_id": {count + 1}}}')
+    return Path(path)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import time
+from typing import Callable, Dict, List, Sequence
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of samples (fraction in 0..1)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Summarizes latencies in seconds measured over elapsed seconds,
+        latencies are reported in milliseconds
+    """
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4) if latencies else 0.0,
+        "ops_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def time_calls(fn: Callable[[int], object], calls: int) -> Dict[str, float]:
+    """Calls fn(i) calls times and summarizes the latency of each call"""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(calls):
+        began = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class CachedResponse(NamedTuple):
+    """Pre-serialized response body with the catalog version it was built from
+        variants keeps the other representations of the body (MessagePack,
+        compressed) once built, key -> (etag, body, media type, encoding)
+    """
+    version: int
+    etag: str
+    body: bytes
+    media_type: str
+    variants: Dict[tuple, Tuple[str, bytes, str, Optional[str]]]
+
+
+def make_etag(body: bytes) -> str:
+    """Returns a strong ETag for a response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def variant_etag(etag: str, *tags: Optional[str]) -> str:
+    """Returns the ETag of another representation of a body, each
+        representation needs its own strong ETag
+    """
+    tags = [tag for tag in tags if tag]
+    return etag[:-1] + "".join("-" + tag for tag in tags) + '"' if tags else etag
+
+
+def opaque_tag(etag: str) -> str:
+    """Returns an ETag without its weak W/ prefix"""
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against an ETag, with the weak
+        comparison of RFC 9110: W/"x" matches "x" (proxies and browsers
+        send back weakened tags)
+    """
+    if not if_none_match:
+        return False
+    candidates = [opaque_tag(candidate.strip()) for candidate in if_none_match.split(",")]
+    return "*" in candidates or opaque_tag(etag) in candidates
+
+
+def entry_size(entry: CachedResponse) -> int:
+    """Bytes held by an entry, its body and every variant built from it"""
+    return len(entry.body) + sum(len(variant[1]) for variant in entry.variants.values())
+
+
+class ResponseCache:
+    """Bounded LRU cache of serialized responses keyed by route and params
+        Entries built from an older catalog version are treated as misses
+        and dropped, so every mutation invalidates the cache
+        Bounded by entries and by the bytes of every body and variant, a
+        body or variant bigger than max_entry_bytes is not kept
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 max_entry_bytes: int = 1024 * 1024):
+        self.max_entries: int = max(1, max_entries)
+        self.max_bytes: int = max(0, max_bytes)
+        self.max_entry_bytes: int = min(max(0, max_entry_bytes), self.max_bytes)
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size: int = 0 # bytes held by the entries
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple, version: int) -> Optional[CachedResponse]:
+        """Returns the cached response if it matches the catalog version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def cacheable(self, body: bytes) -> bool:
+        """Checks if a body is small enough to be kept"""
+        return len(body) <= self.max_entry_bytes
+
+    def put(self, key: tuple, entry: CachedResponse) -> None:
+        """Stores a response, evicting the least recently used entries"""
+        if not self.cacheable(entry.body):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size += entry_size(entry)
+            self._evict()
+
+    def add_variant(self, key: tuple, entry: CachedResponse, representation: tuple,
+                    variant: Tuple[str, bytes, str, Optional[str]]) -> None:
+        """Keeps another representation of a cached entry, counted in the
+            cache size, nothing is kept if the entry was evicted meanwhile
+        """
+        if not self.cacheable(variant[1]):
+            return
+        with self._lock:
+            if self._entries.get(key) is not entry or representation in entry.variants:
+                return
+            entry.variants[representation] = variant
+            self.size += len(variant[1])
+            self._evict()
+
+    def _remove(self, key: tuple) -> None:
+        """Drops an entry, caller holds the lock"""
+        self.size -= entry_size(self._entries.pop(key))
+
+    def _evict(self) -> None:
+        """Drops the least recently used entries over the bounds, caller
+            holds the lock
+        """
+        while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Drops every entry"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import threading
+from collections import deque
+from typing import Iterable, List, Optional, Tuple
+
+
+# Events kept by default, older ones are dropped first
+DEFAULT_CHANGE_FEED_SIZE = 10000
+
+
+class ChangesExpired(Exception):
+    """The changes after since are no longer all in the feed, or since is
+        ahead of it (seen before a restart, or in a snapshot this process
+        has not caught up with), the client must reload the whole catalog
+        (export) and resume from its sequence
+    """
+    def __init__(self, since: int, floor: int, last_seq: int):
+        reason = f"the feed ends at {last_seq}" if since > last_seq else f"the feed starts after {floor}"
+        super().__init__(f"Changes after {since} are not available, {reason}")
+        self.since = since
+        self.floor = floor
+        self.last_seq = last_seq
+
+
+class ChangeFeed:
+    """Bounded, sequenced log of the catalog changes
+        Each event is (seq, type, id, record): type is created, updated or
+        deleted and record the new version (None when deleted). The
+        sequence is the on-disk version of the change, so it only grows
+        and is the same in every process sharing the files; the events of
+        one batch share its sequence
+        Changes up to floor are not in the feed (before startup or dropped
+        from the ring buffer)
+    """
+    def __init__(self, size: int = DEFAULT_CHANGE_FEED_SIZE):
+        self._events: deque = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+        self.floor: int = 0
+        self.last_seq: int = 0
+
+    def reset(self, seq: int) -> None:
+        """Forgets every event, the history now starts after seq"""
+        with self._lock:
+            self._events.clear()
+            self.floor = self.last_seq = seq
+
+    def record(self, seq: int, changes: Iterable[Tuple[Optional[object], Optional[object]]]) -> None:
+        """Appends the events of the (previous, current) record pairs of a change"""
+        with self._lock:
+            events = self._events
+            for previous, current in changes:
+                if current is None and previous is None:
+                    continue
+                if len(events) == events.maxlen:
+                    self.floor = max(self.floor, events[0][0])
+                if current is None:
+                    events.append((seq, "deleted", previous.id, None))
+                else:
+                    events.append((seq, "created" if previous is None else "updated", current.id, current))
+            self.last_seq = max(self.last_seq, seq)
+
+    def since(self, since: int, limit: Optional[int] = None) -> Tuple[List[tuple], int, bool]:
+        """Returns the events after since, oldest first, the sequence to
+            resume from and whether more events follow
+            A page never splits the events of one sequence, so it can hold
+            more than limit events
+            Raises ChangesExpired if events after since were dropped or since
+            is ahead of the feed, the events in between would never be sent
+        """
+        with self._lock:
+            if since < self.floor or since > self.last_seq:
+                raise ChangesExpired(since, self.floor, self.last_seq)
+            # walks back from the newest event, O(changes after since)
+            events = []
+            for event in reversed(self._events):
+                if event[0] <= since:
+                    break
+                events.append(event)
+            last_seq = self.last_seq
+        events.reverse()
+        if limit is None or len(events) <= limit:
+            return events, max(since, last_seq), False
+        end = limit
+        while end < len(events) and events[end][0] == events[limit - 1][0]:
+            end += 1
+        if end == len(events):
+            return events, max(since, last_seq), False
+        return events[:end], events[end - 1][0], True
+
+
+def event_to_dict(event: tuple) -> dict:
+    """Returns the API form of a feed event"""
+    seq, kind, movie_id, record = event
+    return {"seq": seq, "type": kind, "id": movie_id, "movie": record.to_dict() if record is not None else None}
@@ -19,8 +19,69 @@ class Settings(BaseSettings):
     #CORS settings
     cors_origins: List[str] = ["*"]
     
-    # database file settings
+    # storage backend: "json" (in memory + journal) or "sqlite"
+    storage_backend: str = "json"
+    
+    # database file settings, relative to the working directory
     database_file: str = "movies.json"
+    # snapshot format: "json" (one indented document) or "lines" (one movie
+    # per line, memory mapped at startup with offsets and indexes sidecars)
+    snapshot_format: str = "json"
+    # append mutations to a journal instead of rewriting the whole file
+    journal_enabled: bool = True
+    # number of journal records before compacting into the snapshot
+    journal_compact_threshold: int = 1000
+    # movie fields indexed for text search (title, director, synopsis)
+    search_fields: List[str] = ["title"]
+    # flush writes from a background thread (group commit)
+    group_commit: bool = True
+    # group commit flushes at most every interval or after max pending mutations
+    flush_interval_ms: int = 50
+    flush_max_pending: int = 256
+    # durable=true writes fail with 503 when not on disk within this time
+    durable_timeout_ms: int = 5000
+    # share the database files between several worker processes
+    # (uvicorn --workers N), writes take a file lock and flush synchronously
+    shared_storage: bool = False
+    # rows validated together by the bulk import endpoint
+    bulk_batch_size: int = 500
+    
+    # cache of serialized GET responses, invalidated by any catalog change
+    response_cache_enabled: bool = True
+    response_cache_size: int = 1024
+    # bytes kept by the cache (bodies and their variants), bigger bodies
+    # such as a whole unpaginated catalog are served without caching
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entry_bytes: int = 1024 * 1024
+    
+    # build list responses from pre-encoded movies, skipping model validation
+    fast_responses: bool = False
+    
+    # request and storage metrics served at /metrics (Prometheus text format)
+    metrics_enabled: bool = True
+    # sample the stacks of running requests and keep the profiles of the
+    # requests slower than profiler_slow_ms, served at /debug/profiles
+    profiler_enabled: bool = False
+    profiler_interval_ms: int = 10
+    profiler_slow_ms: int = 500
+    profiler_keep: int = 20
+    
+    # compress responses of at least compression_min_size bytes with br
+    # (needs the brotli package) or gzip, as accepted by the client
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 5
+    # answer Accept: application/msgpack with MessagePack (needs msgpack)
+    msgpack_enabled: bool = True
+    
+    # changes kept for /movies/changes, clients further behind re-export
+    change_feed_size: int = 10000
+    
+    # sqlite backend settings
+    sqlite_url: str = "sqlite:///./movies.db"
+    sqlite_pool_size: int = 5
+    sql_echo: bool = False
     
     #Predefined path  
     docs_url: str = "/docs"
@@ -1,27 +1,66 @@
 #!usr/bin/env python3
 import os
 import json
+import threading
+import time
+import atexit
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from change_feed import DEFAULT_CHANGE_FEED_SIZE, ChangeFeed, event_to_dict
+from indexes import SORTED_FIELDS, CatalogIndexes, normalize_key
+from line_snapshot import (LINES_FORMAT, LazyMovies, encoded_items, read_header, read_sidecar, scan_lines,
+                           snapshot_identity, write_lines, write_sidecar)
+from records import MovieRecord
+from metrics import FLUSH_BYTES, FLUSH_DURATION, STORAGE_DURATION
+from process_lock import ProcessLock
+from storage import (FILTER_FIELDS, RANGE_FILTERS, IdempotencyKeys, MovieStorage, NotDurable, batch_fingerprint,
+                     make_sort_key, parse_sort, select_page)
 
 
-#Step 23 Define default database file path
-# Step 25 
-os.chdir("../movie-catalog-api")
+#Step 23 Define default database file path, relative to the working directory
 DEFAULT_DB_FILE = Path("movies.json")
 
 # Define a safe method to get the database file path
 # I changed the way to define the path the function .with_name(filename) was givin me an error
 DB_PATH: Path =  Path.cwd() / DEFAULT_DB_FILE
 
+# Journal settings, every mutation is appended to "<database file>.log"
+JOURNAL_SUFFIX = ".log"
+# Lock file serializing the writers of several processes
+LOCK_SUFFIX = ".lock"
+# Snapshot formats, "lines" is loaded lazily through the sidecars below
+SNAPSHOT_FORMATS = ("json", LINES_FORMAT)
+OFFSETS_SUFFIX = ".offsets" # ids and line offsets of a lines snapshot
+INDEX_SUFFIX = ".idx" # pickled secondary indexes of a lines snapshot
+DEFAULT_COMPACT_THRESHOLD = 1000
+# Group commit defaults, flush at most every interval or after max pending mutations
+DEFAULT_FLUSH_INTERVAL_MS = 50
+DEFAULT_FLUSH_MAX_PENDING = 256
+# Longest wait of a durable write for its flush before it fails
+DEFAULT_DURABLE_TIMEOUT_MS = 5000
+
 def get_db_path() -> Path:
     """Returns the path to the database file"""
     return DB_PATH
 
+def get_journal_path(db_path: Path) -> Path:
+    """Returns the path of the write-ahead log next to the database file"""
+    return db_path.with_name(db_path.name + JOURNAL_SUFFIX)
+
+def get_lock_path(db_path: Path) -> Path:
+    """Returns the path of the cross-process lock file"""
+    return db_path.with_name(db_path.name + LOCK_SUFFIX)
+
+def get_sidecar_path(db_path: Path, suffix: str) -> Path:
+    """Returns the path of a file derived from the snapshot"""
+    return db_path.with_name(db_path.name + suffix)
+
 # Step 24 Ensure database file exists
-def ensure_db_file_exists()-> Path:
+def ensure_db_file_exists(path: Optional[Path] = None)-> Path:
     """Make sure the file database exists, create if not"""
-    path = get_db_path()
+    path = path or get_db_path()
     if not path.exists():
         path.parent.mkdir(parents = True, exist_ok = True)
         path.touch(exist_ok = True)
@@ -29,31 +68,180 @@ def ensure_db_file_exists()-> Path:
         path.write_text(json.dumps({"movies": [], "next_id":1},ensure_ascii = False, indent = 2),encoding="utf-8")
     return path
 
+class _RangeIds:
+    """Lazy ids of a slice of a sorted index, materialized only if chosen"""
+    def __init__(self, keys: list, start: int, end: int):
+        self.keys, self.start, self.end = keys, start, end
+    
+    def __iter__(self) -> Iterator[int]:
+        return (key[-1] for key in self.keys[self.start:self.end])
+
+def _export(records: List[MovieRecord], encoded: bool) -> List[Union[dict, bytes]]:
+    """Converts records for the API, as dicts or as cached JSON fragments"""
+    with STORAGE_DURATION.time(operation="serialize"):
+        if encoded:
+            return [record.to_json() for record in records]
+        return [record.to_dict() for record in records]
+
+def _in_range(value, low, high) -> bool:
+    """Checks low <= value <= high, missing bounds are open"""
+    return value is not None and (low is None or value >= low) and (high is None or value <= high)
+
+def _complete_size(log) -> int:
+    """Truncates a journal opened in a+b mode after its last complete
+        record, only called under the write lock so no append is in
+        progress, returns the new size
+    """
+    size = os.fstat(log.fileno()).st_size
+    end = size
+    while end > 0:
+        start = max(0, end - 4096)
+        log.seek(start)
+        chunk = log.read(end - start)
+        newline = chunk.rfind(b"\n")
+        if newline != -1:
+            end = start + newline + 1
+            break
+        end = start
+    if end != size:
+        print(f"[MovieDatabase._append_journal] truncating {size - end} bytes of a torn journal record")
+        os.ftruncate(log.fileno(), end)
+    return end
+
+def _fsync_dir(path: Path) -> None:
+    """Makes a rename into the directory of path durable, Windows cannot
+        open a directory (and needs no fsync of it)
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 #Define class movidatabase 
-class MovieDatabase:
+class MovieDatabase(MovieStorage):
     #Step 25
     #step 27 Adding Optional Path to __init__
-    """Class to handle database movies catalog in memory"""
-    def __init__(self, file_path: Optional[str] = None):
+    """Class to handle database movies catalog in memory
+        With journal enabled every mutation appends one record to the log
+        and the log is compacted into the JSON snapshot every
+        compact_threshold records
+        Thread safety: writers serialize on one lock, published MovieRecords
+        are never modified (updates swap in a new record) and readers take
+        C level snapshots of the containers, so they never block
+        With group_commit a background thread flushes the mutations to
+        disk, otherwise every mutation is flushed before returning
+        With shared several processes can use the same files: writers hold
+        a file lock, catch up with the journal written by the others and
+        flush before releasing it, readers call refresh() to apply the new
+        journal records incrementally. Every journal record carries the
+        on-disk version "v", which only grows, and the snapshot stores the
+        version it contains
+        With snapshot_format "lines" the snapshot has one movie per line:
+        startup memory maps it and decodes movies on demand (LazyMovies),
+        the line offsets and the secondary indexes are read from sidecar
+        files, the indexes in a background thread (queries wait for them)
+    """
+    def __init__(self, file_path: Optional[str] = None, journal: bool = True,
+                 compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+                 search_fields: Sequence[str] = ("title",),
+                 group_commit: bool = False,
+                 flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+                 flush_max_pending: int = DEFAULT_FLUSH_MAX_PENDING,
+                 durable_timeout_ms: int = DEFAULT_DURABLE_TIMEOUT_MS,
+                 shared: bool = False,
+                 snapshot_format: str = "json",
+                 change_feed_size: int = DEFAULT_CHANGE_FEED_SIZE):
         #internal dictionary to store movies
-        self.movies:dict[int,dict] = {}
+        # compact read-only records, dicts are only built for the API
+        self.movies:dict[int,MovieRecord] = {}
         self.next_id: int = 1 # id for each new movie added will be incremented
+        # incremented on every mutation, lets readers detect changes
+        self.version: int = 0
+        # last on-disk version applied, shared by every process using the files
+        self.disk_version: int = 0
+        self._lock = threading.RLock()
         
         # Ruta del archivo 
         self._file_path: Path = Path(file_path) if file_path else get_db_path()
-        ensure_db_file_exists()
-        self.load_data()
+        self._shared: bool = shared
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format : {snapshot_format}, valid formats: {', '.join(SNAPSHOT_FORMATS)}")
+        self._snapshot_format: str = snapshot_format
+        self._offsets_path: Path = get_sidecar_path(self._file_path, OFFSETS_SUFFIX)
+        self._index_path: Path = get_sidecar_path(self._file_path, INDEX_SUFFIX)
+        self._index_identity: Optional[tuple] = None # snapshot the saved indexes belong to
+        # other processes only see the journal, so sharing needs it
+        self._journal_enabled: bool = journal or shared
+        self._journal_path: Path = get_journal_path(self._file_path)
+        self._journal_size: int = 0 # records appended since last snapshot
+        # (inode, offset, first line) read so far, the first line tells a new
+        # journal reusing a freed inode apart from the one read
+        self._journal_state: Optional[Tuple[int, int, bytes]] = None
+        self._compact_threshold: int = max(1, compact_threshold)
+        
+        # persistence state, lock order is _write_lock -> _lock -> _flush_cond
+        # one flush at a time, across processes when shared
+        self._write_lock = ProcessLock(get_lock_path(self._file_path)) if shared else threading.RLock()
+        self._flush_cond = threading.Condition()
+        self._pending: list[str] = [] # journal lines not written yet
+        self._dirty: bool = False # snapshot must be rewritten
+        self._commit_seq: int = 0 # mutations accepted
+        self._durable_seq: int = 0 # mutations on disk
+        # writes must reach the journal before the file lock is released
+        self._group_commit: bool = group_commit and not shared
+        self._flush_interval: float = max(0, flush_interval_ms) / 1000
+        self._flush_max_pending: int = max(1, flush_max_pending)
+        self._durable_timeout: float = max(0, durable_timeout_ms) / 1000
+        self._flusher: Optional[threading.Thread] = None
+        self._closed: bool = False
+        
+        # secondary indexes, swapped as a whole when rebuilt
+        self._search_fields: Tuple[str, ...] = tuple(search_fields)
+        # results of the batch operations by idempotency key, also rebuilt
+        # from the journal so retries after a restart are recognized
+        self._batch_keys = IdempotencyKeys()
+        # last changes with their on-disk version, for incremental sync
+        self.changes = ChangeFeed(change_feed_size)
+        self._indexes: Optional[CatalogIndexes] = None
+        self._indexes_loaded = threading.Event()
+        ensure_db_file_exists(self._file_path)
+        self.load_data(background_indexes=True)
+        if self._group_commit:
+            self._flusher = threading.Thread(target=self._flusher_loop, name="movie-db-flusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
     
     # Step 27 Data Consistency
-    def load_data(self) -> None:
+    def load_data(self, background_indexes: bool = False) -> None:
         """Read json database and movies
-            If file empty or corrupt re-initialize
+            If file empty re-initialize, if it cannot be read or parsed the
+            error is raised and the snapshot and journal are left as they are
+            background_indexes loads the indexes of a lines snapshot in a
+            background thread
         """
+        with self._write_lock, self._lock:
+            self._load_data(background_indexes)
+            self.version += 1
+    
+    def _load_data(self, background_indexes: bool = False) -> None:
+        """Loads snapshot and journal, caller holds the lock"""
+        indexed = False
         try:
+            header = read_header(self._file_path)
+            if header is not None:
+                self._load_lines(header, background_indexes)
+                indexed = True
+                return
             text = self._file_path.read_text(encoding="utf-8").strip()
             if not text:
                 self.movies = {}
                 self.next_id = 1
+                self.disk_version = 0
+                self._replay_journal()
                 self.save_data()
                 return
             
@@ -62,6 +250,8 @@ class MovieDatabase:
             #Step 27 data structure validation
             movies_list: List[Dict] = data.get("movies",[])
             next_id_val: int = data.get("next_id",1)
+            version_val: int = data.get("version", 0)
+            self.disk_version = version_val if isinstance(version_val, int) else 0
             
             # Load in memory as dict
             self.movies = {}
@@ -69,19 +259,123 @@ class MovieDatabase:
                 #find id
                 movie_id = item.get("id")
                 if isinstance(movie_id, int):
-                    self.movies[movie_id] = item
+                    try:
+                        self.movies[movie_id] = MovieRecord.from_dict(item)
+                    except TypeError:
+                        print(f"[MovieDatabase.load_data] skipping invalid movie {movie_id}")
                     
             # if next id empty
             if isinstance(next_id_val, int) and next_id_val > 0:
                 self.next_id = next_id_val
             else:
                 self.next_id = (max(self.movies.keys())+1) if self.movies else 1  
+            
+            # replay the mutations written after the snapshot
+            self._replay_journal()
         except Exception as e:
-            # if something goes wrong restart
+            # nothing is written: saving the empty catalog would replace the
+            # snapshot and the journal, losing everything over a read error
             print(f"[MovieDatabase.load_data] error loading datos: {e}")
-            self.movies={}
-            self.next_id = 1
-            self.save_data()
+            raise
+        finally:
+            if not indexed:
+                self._rebuild_indexes()
+    
+    def _load_lines(self, header: dict, background_indexes: bool) -> None:
+        """Loads a lines snapshot lazily, caller holds the lock
+            Only the header, the offsets sidecar and the journal are read,
+            movies are decoded from the memory mapped file when accessed
+        """
+        version_val, next_id_val = header.get("version", 0), header.get("next_id", 1)
+        self.disk_version = version_val if isinstance(version_val, int) else 0
+        self.next_id = next_id_val if isinstance(next_id_val, int) and next_id_val > 0 else 1
+        identity = snapshot_identity(self._file_path, self.disk_version)
+        offsets = read_sidecar(self._offsets_path, identity)
+        if offsets is None:
+            offsets = scan_lines(self._file_path)
+            self._save_sidecar(self._offsets_path, identity, offsets)
+        self.movies = LazyMovies(self._file_path, *offsets)
+        if offsets[0]:
+            self.next_id = max(self.next_id, offsets[0][-1] + 1)
+        changes = self._replay_journal()
+        
+        self._indexes = None
+        self._indexes_loaded.clear()
+        if background_indexes:
+            threading.Thread(target=self._load_indexes, args=(identity, changes),
+                             name="movie-db-indexes", daemon=True).start()
+        else:
+            self._load_indexes(identity, changes)
+    
+    def _load_indexes(self, identity: tuple, changes: list) -> None:
+        """Loads the indexes sidecar and applies the journal changes, or
+            builds the indexes from every movie if the sidecar is stale
+            Writers wait for the indexes before changing anything
+        """
+        try:
+            indexes = read_sidecar(self._index_path, identity)
+            if isinstance(indexes, CatalogIndexes) and indexes.search.fields == self._search_fields:
+                self._index_identity = identity
+                for previous, current in changes:
+                    indexes.apply(previous, current)
+            else:
+                indexes = CatalogIndexes.build(self.movies.values(), self._search_fields)
+                if not changes:
+                    self._save_sidecar(self._index_path, identity, indexes)
+                    self._index_identity = identity
+            self._indexes = indexes
+        finally:
+            self._indexes_loaded.set()
+    
+    def _save_sidecar(self, path: Path, identity: tuple, payload) -> None:
+        """Writes a sidecar, they are only a startup shortcut so a failure is
+            logged and the data rebuilt at the next start
+        """
+        try:
+            write_sidecar(path, identity, payload)
+        except Exception as e:
+            print(f"[MovieDatabase._save_sidecar] Error saving {path.name}: {e}")
+    
+    def save_index_sidecar(self) -> bool:
+        """Folds the journal into a lines snapshot and saves the indexes
+            next to it, so the next start does not rebuild them
+            Returns False if a write happened meanwhile (nothing saved)
+        """
+        if self._snapshot_format != LINES_FORMAT:
+            return False
+        with self._write_lock:
+            if not self.flush(snapshot=bool(self._journal_size or read_header(self._file_path) is None)):
+                return False
+            with self._lock:
+                header = read_header(self._file_path)
+                if header is None or header.get("version") != self.disk_version or self._pending:
+                    return False
+                identity = snapshot_identity(self._file_path, self.disk_version)
+                if identity != self._index_identity:
+                    self._save_sidecar(self._index_path, identity, self.indexes)
+                    self._index_identity = identity
+                return True
+    
+    @property
+    def indexes(self) -> CatalogIndexes:
+        """The secondary indexes, waits while they are being loaded"""
+        indexes = self._indexes
+        if indexes is None:
+            self._indexes_loaded.wait()
+            indexes = self._indexes
+        return indexes
+    
+    def _rebuild_indexes(self) -> None:
+        """Builds the secondary indexes from the movies in memory"""
+        self._indexes = CatalogIndexes.build(self.movies.values(), self._search_fields)
+        self._indexes_loaded.set()
+    
+    def _movies_for(self, ids: Optional[Iterable[int]]) -> List[dict]:
+        """Materializes a bucket of ids into movies ordered by id"""
+        if not ids:
+            return []
+        movies = self.movies
+        return [movie.to_dict() for movie in (movies.get(movie_id) for movie_id in sorted(ids)) if movie is not None]
     
     
     def save_data(self)->None:
@@ -91,65 +385,764 @@ class MovieDatabase:
           "movies": [ {...}, {...} ],
           "next_id": <int>
         }
+            The snapshot is written to a temp file, fsynced and swapped in,
+            so a crash never leaves a half written catalog, then the
+            journal is truncated
         """    
+        self.flush(snapshot=True)
+    
+    def compact(self) -> None:
+        """Folds the journal into a fresh snapshot"""
+        self.flush(snapshot=True)
+    
+    def flush(self, snapshot: bool = False) -> bool:
+        """Writes the pending mutations to disk and fsyncs them
+            Appends the pending journal lines, or rewrites the snapshot when
+            the journal is disabled, compaction is due or snapshot is True
+            Returns False if the write failed (mutations stay pending)
+        """
+        with self._write_lock:
+            # a snapshot must include what the other processes wrote
+            if self._shared:
+                self._catch_up()
+            with self._lock, self._flush_cond:
+                seq = self._commit_seq
+                lines, self._pending = self._pending, []
+                dirty, self._dirty = self._dirty, False
+                # a snapshot also covers the pending journal lines
+                snapshot = (snapshot or dirty
+                            or self._journal_enabled and self._journal_size + len(lines) >= self._compact_threshold)
+                data, lazy_changes = None, None
+                if snapshot:
+                    if self._snapshot_format != LINES_FORMAT:
+                        movies = list(self.movies.values())
+                    elif isinstance(self.movies, LazyMovies):
+                        # copies the changes only, the rest streams from the old snapshot
+                        lazy_changes = self.movies.changes()
+                        movies = self.movies.encoded_items(lazy_changes)
+                    else:
+                        movies = encoded_items(list(self.movies.values()))
+                    data = {"movies":movies, "next_id":self.next_id, "version":self.disk_version}
+            kind = "snapshot" if snapshot else "journal"
+            start, written = time.perf_counter(), None
+            try:
+                if snapshot:
+                    written = self._write_snapshot(data, lazy_changes)
+                elif lines:
+                    written = self._append_journal(lines)
+            except Exception as e:
+                print(f"[MovieDatabase.flush] Error saving data: {e}")
+                with self._flush_cond:
+                    self._pending[:0] = lines
+                    self._dirty = self._dirty or dirty or snapshot
+                return False
+            if written is not None:
+                FLUSH_DURATION.observe(time.perf_counter() - start, kind=kind)
+                FLUSH_BYTES.inc(written, kind=kind)
+            with self._flush_cond:
+                self._durable_seq = max(self._durable_seq, seq)
+                self._flush_cond.notify_all()
+            return True
+    
+    def _write_snapshot(self, data: dict, lazy_changes: Optional[tuple] = None) -> int:
+        """Atomically replaces the snapshot (temp file + fsync + os.replace
+            + fsync of the directory)
+            and replaces the journal it supersedes with a new one starting
+            with a base record, the new inode tells other processes that
+            the journal was compacted
+            lazy_changes are the LazyMovies changes the snapshot was written
+            from, the movies are then reopened on the new snapshot
+            Returns the number of bytes written
+        """
+        tmp_path = self._file_path.with_name(self._file_path.name + ".tmp")
+        if self._snapshot_format == LINES_FORMAT:
+            with tmp_path.open("wb") as tmp:
+                offsets = write_lines(tmp, data["movies"], data["next_id"], data["version"])
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            written = os.path.getsize(tmp_path)
+            if lazy_changes is not None:
+                with self._lock:
+                    self.movies = self.movies.reopen(lambda: os.replace(tmp_path, self._file_path), *offsets,
+                                                     lazy_changes)
+            else:
+                os.replace(tmp_path, self._file_path)
+            # the new snapshot must be on disk before the journal is replaced
+            _fsync_dir(self._file_path)
+            self._save_sidecar(self._offsets_path, snapshot_identity(self._file_path, data["version"]), offsets)
+        else:
+            with STORAGE_DURATION.time(operation="snapshot_serialize"):
+                data = {"movies":[movie.to_dict() for movie in data["movies"]], "next_id":data["next_id"], "version":data["version"]}
+                text = json.dumps(data, ensure_ascii = False, indent = 2)
+            with tmp_path.open("w", encoding="utf-8") as tmp:
+                tmp.write(text)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            written = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._file_path)
+            _fsync_dir(self._file_path)
+        if self._journal_enabled:
+            tmp_path = self._journal_path.with_name(self._journal_path.name + ".tmp")
+            base = json.dumps({"op":"base", "v":data["version"]}, separators = (",", ":")) + "\n"
+            with tmp_path.open("wb") as log:
+                log.write(base.encode("utf-8"))
+                log.flush()
+                os.fsync(log.fileno())
+                inode = os.fstat(log.fileno()).st_ino
+            os.replace(tmp_path, self._journal_path)
+            _fsync_dir(self._journal_path)
+            self._journal_size = 0
+            self._journal_state = (inode, len(base.encode("utf-8")), base.encode("utf-8"))
+            written += len(base.encode("utf-8"))
+        return written
+    
+    def _append_journal(self, lines: List[str]) -> int:
+        """Appends journal lines in one write and fsyncs the log
+            A torn last line (crash, failed append) is cut off first, else
+            the new records would be glued to it and lost on replay; a
+            failed append is cut off the same way so it can be retried
+            Returns the number of bytes written
+        """
+        with self._journal_path.open("a+b") as log:
+            start = _complete_size(log)
+            try:
+                written = log.write("".join(lines).encode("utf-8"))
+                log.flush()
+                os.fsync(log.fileno())
+            except OSError:
+                try:
+                    os.ftruncate(log.fileno(), start)
+                except OSError:
+                    pass
+                raise
+            stat = os.fstat(log.fileno())
+            log.seek(0)
+            head = log.readline()
+        self._journal_size += len(lines)
+        # under the write lock nothing else was appended since the last read
+        if self._journal_state is None or self._journal_state[0] == stat.st_ino:
+            self._journal_state = (stat.st_ino, stat.st_size, head)
+        return written
+    
+    def _read_journal(self, offset: int = 0) -> Tuple[List[dict], Tuple[int, int, bytes]]:
+        """Reads the complete journal records after offset
+            Returns (records, (inode, offset after the last complete one,
+            first line)), a torn last line (crash or append in progress) is
+            left for later
+        """
+        entries = []
+        with self._journal_path.open("rb") as log:
+            inode = os.fstat(log.fileno()).st_ino
+            head = log.readline()
+            log.seek(offset)
+            for raw in log:
+                if not raw.endswith(b"\n"):
+                    break
+                offset += len(raw)
+                if not raw.strip():
+                    continue
+                try:
+                    entries.append(json.loads(raw))
+                except ValueError:
+                    print("[MovieDatabase._read_journal] skipping corrupt journal record")
+        return entries, (inode, offset, head)
+    
+    def _replay_journal(self) -> list:
+        """Applies the journal records on top of the loaded snapshot
+            Records already folded into the snapshot (version) are skipped
+            Returns the (previous, new) record of each change
+            The change feed restarts at the snapshot version and gets the
+            replayed changes
+        """
+        self._journal_size = 0
+        self._journal_state = None
+        self.changes.reset(self.disk_version)
+        changes = []
+        if not self._journal_enabled or not self._journal_path.exists():
+            return changes
+        entries, state = self._read_journal()
+        snapshot_version = self.disk_version
+        for entry in entries:
+            if entry.get("op") == "base" or entry.get("v", snapshot_version + 1) <= snapshot_version:
+                continue
+            try:
+                entry_changes = self._apply_entry(entry)
+            except (ValueError, KeyError, TypeError):
+                print("[MovieDatabase._replay_journal] skipping corrupt journal record")
+                continue
+            changes.extend(entry_changes)
+            self.changes.record(self.disk_version, entry_changes)
+            self._journal_size += 1
+        self._journal_state = state
+        return changes
+    
+    def _apply_entry(self, entry: dict) -> List[Tuple[Optional[MovieRecord], Optional[MovieRecord]]]:
+        """Applies one journal record to memory, a batch record holds the
+            records of a whole batch operation
+            Returns (previous, new) record of each movie it changed
+        """
+        op = entry.get("op")
+        changes = []
+        if op == "put":
+            movie = MovieRecord.from_dict(entry["movie"])
+            changes.append((self.movies.get(movie.id), movie))
+            self.movies[movie.id] = movie
+        elif op == "del":
+            changes.append((self.movies.pop(entry["id"], None), None))
+        elif op == "batch":
+            # decode everything first so a corrupt batch changes nothing
+            ops = [("put", MovieRecord.from_dict(item["movie"])) if item["op"] == "put" else ("del", item["id"])
+                   for item in entry["ops"]]
+            for item_op, value in ops:
+                if item_op == "put":
+                    changes.append((self.movies.get(value.id), value))
+                    self.movies[value.id] = value
+                else:
+                    changes.append((self.movies.pop(value, None), None))
+            if entry.get("key") is not None:
+                ids = [value.id if item_op == "put" else value for item_op, value in ops]
+                self._batch_keys.put(entry["key"], entry.get("request"), {"ids":ids, "missing":entry.get("missing", [])})
+        next_id_val = entry.get("next_id")
+        if isinstance(next_id_val, int) and next_id_val > self.next_id:
+            self.next_id = next_id_val
+        version_val = entry.get("v")
+        if isinstance(version_val, int) and version_val > self.disk_version:
+            self.disk_version = version_val
+        return changes
+    
+    def refresh(self) -> bool:
+        """Applies the changes written by other processes since the last
+            call, a stat of the journal when nothing changed
+            Returns True if the catalog changed
+        """
+        if not self._shared or not self._journal_changed():
+            return False
+        with self._write_lock:
+            return self._catch_up()
+    
+    def _journal_changed(self) -> bool:
+        """Checks the journal against what was read, without any lock, so
+            it may race with a writer (refresh runs again)
+        """
+        current = self._journal_stat()
+        return current is not None and not (self._continues(current) and self._journal_state[1] == current[1])
+
+    def _journal_stat(self) -> Optional[Tuple[int, int, bytes]]:
+        """Returns (inode, size, first line) of the journal, None if missing"""
         try:
-            data = {
-                "movies":list(self.movies.values()),
-                "next_id": self.next_id
-            }
-            self._file_path.write_text(
-                json.dumps(data, ensure_ascii = False, indent = 2),
-                encoding="utf-8"
-            )
-        except Exception as e:
-            print(f"[MovieDatabase.save_data] Error saving data: {e}")
+            with self._journal_path.open("rb") as log:
+                stat = os.fstat(log.fileno())
+                return stat.st_ino, stat.st_size, log.readline()
+        except FileNotFoundError:
+            return None
+
+    def _continues(self, current: Tuple[int, int, bytes]) -> bool:
+        """Checks if the journal on disk is the one read so far, a compacted
+            journal may get the freed inode of an older one but starts with
+            another base record
+        """
+        state = self._journal_state
+        # nothing read yet, the whole file is read either way
+        return state is not None and state[0] == current[0] and (state[1] == 0 or state[2] == current[2])
+    
+    def _catch_up(self) -> bool:
+        """Applies the journal records appended by other processes, caller
+            holds the write lock. Reloads everything only if the journal
+            was compacted past records this process has not seen
+        """
+        # a background build reads the movies, the records applied meanwhile
+        # would be indexed twice, like _writing waits for it
+        self._indexes_loaded.wait()
+        current = self._journal_stat()
+        if current is None:
+            return False
+        # writers hold the write lock, so the journal cannot be replaced meanwhile
+        if self._continues(current):
+            if self._journal_state[1] == current[1]:
+                return False
+            entries, state = self._read_journal(self._journal_state[1])
+        else:
+            entries, state = self._read_journal()
+            if entries and entries[0].get("op") == "base" and entries[0].get("v") != self.disk_version:
+                # compacted by another process past records we did not see
+                with self._lock:
+                    self._load_data()
+                    self.version += 1
+                return True
+            self._journal_size = 0
+        with self._lock:
+            changed = False
+            for entry in entries:
+                if entry.get("op") == "base" or entry.get("v", self.disk_version + 1) <= self.disk_version:
+                    continue
+                try:
+                    changes = self._apply_entry(entry)
+                except (ValueError, KeyError, TypeError):
+                    print("[MovieDatabase._catch_up] skipping corrupt journal record")
+                    continue
+                self._journal_size += 1
+                for previous, current in changes:
+                    self.indexes.apply(previous, current)
+                self.changes.record(self.disk_version, changes)
+                changed = True
+            self._journal_state = state
+            if changed:
+                self.version += 1
+            return changed
+    
+    @contextmanager
+    def _writing(self):
+        """Holds the write lock around a whole mutation when shared, after
+            catching up, so ids and versions are allocated across processes
+            and the journal is flushed before another process writes
+        """
+        # mutations update the indexes, wait until they are loaded
+        self._indexes_loaded.wait()
+        if not self._shared:
+            yield
+            return
+        with self._write_lock:
+            self._catch_up()
+            yield
+    
+    def _persist(self, *entries: dict) -> int:
+        """Queues mutations for the next flush, caller holds the lock
+            Returns the commit sequence number covering them
+        """
+        lines = []
+        for entry in entries:
+            self.disk_version += 1
+            lines.append(json.dumps({**entry, "v":self.disk_version}, ensure_ascii = False, separators = (",", ":")) + "\n")
+        with self._flush_cond:
+            if self._journal_enabled:
+                self._pending.extend(lines)
+            else:
+                self._dirty = True
+            self._commit_seq += 1
+            # wakes the background writer
+            self._flush_cond.notify_all()
+            return self._commit_seq
+    
+    def _commit(self, seq: int, durable: bool) -> None:
+        """Flushes right away without group commit, else optionally waits
+            for the background flush covering seq
+            Raises NotDurable if a durable write is not on disk in time
+            (failing flushes keep being retried in the background)
+        """
+        if not self._group_commit or self._closed:
+            if not self.flush() and durable:
+                raise NotDurable("The change was applied but could not be written to disk")
+        elif durable and not self.wait_durable(seq, self._durable_timeout):
+            raise NotDurable(f"The change was applied but not confirmed on disk within {self._durable_timeout:g}s")
+    
+    def wait_durable(self, seq: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """Blocks until the mutations up to seq (default: all so far) are on disk"""
+        with self._flush_cond:
+            if seq is None:
+                seq = self._commit_seq
+            return self._flush_cond.wait_for(lambda: self._durable_seq >= seq, timeout)
+    
+    def _flusher_loop(self) -> None:
+        """Background writer, coalesces mutations and flushes them at most
+            every flush interval or once flush_max_pending are queued
+        """
+        while True:
+            with self._flush_cond:
+                self._flush_cond.wait_for(lambda: self._closed or self._commit_seq > self._durable_seq)
+                if self._closed:
+                    return
+                deadline = time.monotonic() + self._flush_interval
+                while not self._closed and self._commit_seq - self._durable_seq < self._flush_max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._flush_cond.wait(remaining)
+            if not self.flush():
+                time.sleep(self._flush_interval or 0.05)
+    
+    def close(self) -> None:
+        """Stops the background writer and flushes what is pending"""
+        with self._flush_cond:
+            self._closed = True
+            self._flush_cond.notify_all()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+            self._flusher = None
+        if self._snapshot_format == LINES_FORMAT:
+            self.save_index_sidecar()
+        else:
+            self.flush()
             
                 
             
     #step 27 Updated to memory operations     
-    def add_movie(self,movie_data: dict) -> dict:
-        """adds new movie to catalog, in memory, does not save in database yet"""
-        movie_id = self.next_id
-        #step 27
-        record = {"id":movie_id, **movie_data}
-        self.movies[movie_id] = record
-        self.next_id += 1
-        
-        # Step 27 
-        self.save_data()
-        return record
+    def add_movie(self,movie_data: dict, durable: bool = False) -> dict:
+        """adds new movie to catalog and persists it
+            durable waits until the movie is on disk
+        """
+        with self._writing():
+            with self._lock:
+                movie_id = self.next_id
+                #step 27
+                record = MovieRecord.from_dict({**movie_data, "id":movie_id})
+                self.movies[movie_id] = record
+                self.indexes.add(record)
+                self.indexes.add_id(movie_id)
+                self.next_id += 1
+                self.version += 1
+            
+                # Step 27 
+                created = record.to_dict()
+                seq = self._persist({"op":"put", "movie":created, "next_id":self.next_id})
+                self.changes.record(self.disk_version, [(None, record)])
+            self._commit(seq, durable)
+            return created
+    
+    def add_movies(self, movies_data: List[dict], durable: bool = False) -> List[dict]:
+        """adds several movies with one block of ids and a single persistence flush"""
+        if not movies_data:
+            return []
+        with self._writing():
+            with self._lock:
+                first_id = self.next_id
+                self.next_id += len(movies_data)
+                created = []
+                for offset, movie_data in enumerate(movies_data):
+                    record = MovieRecord.from_dict({**movie_data, "id":first_id + offset})
+                    self.movies[record.id] = record
+                    self.indexes.add(record)
+                    self.indexes.add_id(record.id)
+                    created.append(record)
+                records = [record.to_dict() for record in created]
+                self.version += 1
+                seq = self._persist(*({"op":"put", "movie":record} for record in records[:-1]),
+                                    {"op":"put", "movie":records[-1], "next_id":self.next_id})
+                # one journal record, so one version, per movie
+                first_version = self.disk_version - len(created) + 1
+                for offset, record in enumerate(created):
+                    self.changes.record(first_version + offset, [(None, record)])
+            self._commit(seq, durable)
+            return records
+    
+    def update_movie(self, movie_id: int, changes: dict, durable: bool = False) -> Optional[dict]:
+        """Applies a partial update to a movie, returns None if not found
+            The stored record is replaced, never modified in place
+        """
+        with self._writing():
+            with self._lock:
+                movie = self.movies.get(movie_id)
+                if movie is None:
+                    return None
+                updated = movie.replace(**{**changes, "id":movie_id})
+                self.movies[movie_id] = updated
+                self.indexes.update(movie, updated)
+                self.version += 1
+                result = updated.to_dict()
+                seq = self._persist({"op":"put", "movie":result})
+                self.changes.record(self.disk_version, [(movie, updated)])
+            self._commit(seq, durable)
+            return result
+    
+    def delete_movie(self, movie_id: int, durable: bool = False) -> Optional[dict]:
+        """Removes a movie from the catalog, returns None if not found"""
+        with self._writing():
+            with self._lock:
+                movie = self.movies.pop(movie_id, None)
+                if movie is None:
+                    return None
+                self.indexes.remove(movie)
+                self.indexes.remove_id(movie_id)
+                self.version += 1
+                seq = self._persist({"op":"del", "id":movie_id})
+                self.changes.record(self.disk_version, [(movie, None)])
+            self._commit(seq, durable)
+            return movie.to_dict()
+    
+    def _select(self, ids: Optional[Iterable[int]], filters: dict) -> Tuple[List[MovieRecord], List[int]]:
+        """Returns the movies selected by a batch operation and the
+            requested ids that were not found or do not match the filters
+            Raises ValueError if neither ids nor a filter is given
+        """
+        matched = self._filter_ids(filters)
+        if ids is None:
+            if matched is None:
+                raise ValueError("A batch operation needs ids or at least one filter")
+            movies = self.movies
+            return [movie for movie in (movies.get(movie_id) for movie_id in matched) if movie is not None], []
+        allowed = None if matched is None else set(matched)
+        selected, missing = [], []
+        for movie_id in dict.fromkeys(ids):
+            movie = self.movies.get(movie_id)
+            if movie is None or (allowed is not None and movie_id not in allowed):
+                missing.append(movie_id)
+            else:
+                selected.append(movie)
+        return selected, missing
+    
+    def _apply_batch(self, op: str, changes: Optional[dict], ids: Optional[Iterable[int]], key: Optional[str],
+                     durable: bool, filters: dict) -> dict:
+        """Runs a batch update ("put") or delete ("del") as one journal
+            record, so it is replayed entirely or not at all
+        """
+        ids = list(ids) if ids is not None else None
+        fingerprint = batch_fingerprint(op, changes, ids, filters) if key is not None else None
+        with self._writing():
+            with self._lock:
+                if key is not None:
+                    result = self._batch_keys.get(key, fingerprint)
+                    if result is not None:
+                        return result
+                selected, missing = self._select(ids, filters)
+                if op == "put":
+                    # every record is built before anything changes
+                    updated = [movie.replace(**{**changes, "id":movie.id}) for movie in selected]
+                    for previous, current in zip(selected, updated):
+                        self.movies[current.id] = current
+                        self.indexes.update(previous, current)
+                    ops = [{"op":"put", "movie":movie.to_dict()} for movie in updated]
+                    pairs = list(zip(selected, updated))
+                else:
+                    for movie in selected:
+                        self.movies.pop(movie.id, None)
+                        self.indexes.remove(movie)
+                        self.indexes.remove_id(movie.id)
+                    ops = [{"op":"del", "id":movie.id} for movie in selected]
+                    pairs = [(movie, None) for movie in selected]
+                result = {"ids":[movie.id for movie in selected], "missing":missing, "replayed":False}
+                if not ops and key is None:
+                    return result
+                if ops:
+                    self.version += 1
+                seq = self._persist({"op":"batch", "ops":ops, "key":key, "request":fingerprint, "missing":missing})
+                self.changes.record(self.disk_version, pairs)
+                if key is not None:
+                    self._batch_keys.put(key, fingerprint, result)
+            self._commit(seq, durable)
+            return result
+    
+    def update_movies(self, changes: dict, ids: Optional[Iterable[int]] = None, key: Optional[str] = None,
+                      durable: bool = False, **filters) -> dict:
+        """Applies the same partial update to every selected movie, all in
+            memory under the lock, persisted as one journal record
+        """
+        return self._apply_batch("put", changes, ids, key, durable, filters)
+    
+    def delete_movies(self, ids: Optional[Iterable[int]] = None, key: Optional[str] = None,
+                      durable: bool = False, **filters) -> dict:
+        """Deletes every selected movie, persisted as one journal record"""
+        return self._apply_batch("del", None, ids, key, durable, filters)
     
     #This method searches for a matching text in the title of the movies
-    def search_movies(self, query: str) -> List[dict]:
-        """searches movies by text contained in the title"""
-        query_lower = query.lower()
-        movie_list= []
-        for movie in self.movies.values():
-            title_list = movie.get("title","").lower().split()
-            if query_lower in title_list:
-                movie_list.append(movie)
-        return movie_list
+    def search_movies(self, query: str, fuzzy: bool = False) -> List[dict]:
+        """searches movies by words contained in the title
+            Every word must match, "inter*" matches as prefix,
+            results come ranked by relevance
+            fuzzy matches misspelled title and director words
+        """
+        movies = self.movies
+        return [movie.to_dict() for movie in (movies.get(movie_id) for movie_id, _ in self.search_ranked(query, fuzzy))
+                if movie is not None]
+    
+    def search_ranked(self, query: str, fuzzy: bool = False) -> List[Tuple[int, float]]:
+        """Returns the (movie id, score) pairs matching a search query,
+            fuzzy goes through the trigram index
+        """
+        if fuzzy:
+            with STORAGE_DURATION.time(operation="fuzzy_search"):
+                return self.indexes.fuzzy.search(query)
+        with STORAGE_DURATION.time(operation="search"):
+            return self.indexes.search.search(query)
+    
+    def count_movies(self, **filters) -> int:
+        """Returns the number of movies matching the filters (all if none)"""
+        ids = self._filter_ids(filters)
+        return len(self.movies) if ids is None else len(ids)
+    
+    def query_movies(self, sort: str = "id", limit: Optional[int] = None, after: Optional[tuple] = None,
+                     encoded: bool = False, **filters) -> Tuple[List[Union[dict, bytes]], Optional[tuple], int]:
+        """Returns one page of the movies matching the filters and the total,
+            planning the filters only once
+            encoded returns the JSON fragments cached on the records
+        """
+        ids = self._filter_ids(filters)
+        page, last_key = self.page_movies(ids, sort=sort, limit=limit, after=after)
+        total = len(self.movies) if ids is None else len(ids)
+        return _export(page, encoded), last_key, total
+    
+    def find_movies(self, sort: str = "id", limit: Optional[int] = None, after: Optional[tuple] = None,
+                    **filters) -> Tuple[List[dict], Optional[tuple]]:
+        """Returns one page of the movies matching the filters"""
+        page, last_key = self.page_movies(self._filter_ids(filters), sort=sort, limit=limit, after=after)
+        return [movie.to_dict() for movie in page], last_key
+    
+    def search_page(self, query: str, sort: str = "relevance", limit: Optional[int] = None,
+                    after: Optional[tuple] = None, encoded: bool = False,
+                    fuzzy: bool = False) -> Tuple[List[Union[dict, bytes]], Optional[tuple], int]:
+        """Returns one page of the movies matching a text query"""
+        scores = dict(self.search_ranked(query, fuzzy))
+        if not scores:
+            return [], None, 0
+        page, last_key = self.page_movies(scores.keys(), sort=sort, limit=limit, after=after, scores=scores)
+        return _export(page, encoded), last_key, len(scores)
+    
+    def changes_since(self, since: int, limit: Optional[int] = None) -> Tuple[List[dict], int, bool]:
+        """Returns the changes after the sequence since, the sequence to
+            resume from and whether more changes follow
+            Raises ChangesExpired when they are no longer all in the feed
+            or since is ahead of it
+        """
+        if self._shared and since > self.changes.last_seq:
+            # the client may have seen a worker this one has not caught up with
+            self.refresh()
+        events, last_seq, more = self.changes.since(since, limit)
+        return [event_to_dict(event) for event in events], last_seq, more
+    
+    @property
+    def change_seq(self) -> int:
+        """Sequence of the last change applied in memory"""
+        return self.changes.last_seq
+    
+    def catalog_stats(self, group_by: Optional[str] = None) -> dict:
+        """Returns the catalog aggregates, O(groups) as they are kept up to
+            date by every write
+        """
+        # the lock keeps a write from being seen half applied
+        with self._lock:
+            return self.indexes.stats.summary(group_by)
+    
+    def _filter_ids(self, filters: dict) -> Optional[List[int]]:
+        """Returns the ids matching every filter, None means no filter
+            Each filter gives a candidate set whose size is known from the
+            indexes (buckets, or bisect on the sorted indexes for ranges),
+            only the smallest is materialized and checked against the others
+        """
+        with STORAGE_DURATION.time(operation="index_lookup"):
+            ranges: Dict[str, list] = {}
+            conditions = [] # (size, candidate ids, predicate)
+            for name, value in filters.items():
+                if value is None:
+                    continue
+                if name in RANGE_FILTERS:
+                    field, bound = RANGE_FILTERS[name]
+                    ranges.setdefault(field, [None, None])[bound == "max"] = value
+                elif name == "year":
+                    bucket = self.ids_by_year(value)
+                    conditions.append((len(bucket), bucket, lambda movie, value=value: movie.year == value))
+                elif name in ("director", "genre"):
+                    key = normalize_key(value)
+                    bucket = self.ids_by_director(value) if name == "director" else self.ids_by_genre(value)
+                    conditions.append((len(bucket), bucket,
+                                       lambda movie, name=name, key=key: normalize_key(movie.get(name) or "") == key))
+                elif name == "is_watched":
+                    bucket = self.indexes.by_watched[bool(value)]
+                    conditions.append((len(bucket), bucket, lambda movie, value=bool(value): bool(movie.is_watched) == value))
+                else:
+                    raise ValueError(f"Cannot filter by {name}, valid filters: {', '.join(FILTER_FIELDS)}")
+            for field, (low, high) in ranges.items():
+                keys = self.indexes.sorted[field]
+                start = bisect_left(keys, (True,) if low is None else (True, low))
+                end = len(keys) if high is None else bisect_right(keys, (True, high, float("inf")))
+                conditions.append((max(0, end - start), _RangeIds(keys, start, end),
+                                   lambda movie, field=field, low=low, high=high: _in_range(movie.get(field), low, high)))
+            if not conditions:
+                return None
+        
+            conditions.sort(key=lambda condition: condition[0])
+            ids = tuple(conditions[0][1])
+            if len(conditions) == 1:
+                return list(ids)
+            predicates = [condition[2] for condition in conditions[1:]]
+            movies = self.movies
+            return [movie_id for movie_id in ids
+                    if (movie := movies.get(movie_id)) is not None and all(predicate(movie) for predicate in predicates)]
+    
+    def ids_by_year(self, year: int) -> set:
+        """Returns the ids of the movies released in a given year"""
+        return self.indexes.by_year.get(year, set())
+    
+    def ids_by_director(self, director: str) -> set:
+        """Returns the ids of the movies by a given director"""
+        return self.indexes.by_director.get(normalize_key(director), set())
+    
+    def ids_by_genre(self, genre: str) -> set:
+        """Returns the ids of the movies of a given genre"""
+        return self.indexes.by_genre.get(normalize_key(genre), set())
+    
+    def page_movies(self, ids: Optional[Iterable[int]] = None, sort: str = "id", limit: Optional[int] = None,
+                    after: Optional[tuple] = None,
+                    scores: Optional[Dict[int, float]] = None) -> Tuple[List[MovieRecord], Optional[tuple]]:
+        """Returns one page of movie records and the sort key to continue after
+            ids restricts the candidates (whole catalog if None), after is
+            the sort key of the last movie of the previous page (keyset)
+        """
+        field, descending = parse_sort(sort)
+        key = make_sort_key(field, scores)
+        
+        # whole catalog sorted by an indexed field: slice the sorted index
+        # from the cursor, O(log n + limit) for top-k and deep pages
+        if ids is None and (field == "id" or field in SORTED_FIELDS):
+            keys = self.indexes.ids if field == "id" else self.indexes.sorted[field]
+            position = after[0] if field == "id" and after else after
+            if descending:
+                end = bisect_left(keys, position) if after else len(keys)
+                start = 0 if limit is None else max(0, end - limit - 1)
+                page_keys = keys[start:end][::-1]
+            else:
+                start = bisect_right(keys, position) if after else 0
+                end = len(keys) if limit is None else start + limit + 1
+                page_keys = keys[start:end]
+            page_ids = page_keys if field == "id" else [page_key[-1] for page_key in page_keys]
+            candidates = [movie for movie in map(self.movies.get, page_ids) if movie is not None]
+            if limit is None or len(candidates) <= limit:
+                return candidates, None
+            page = candidates[:limit]
+            return page, key(page[-1])
+        
+        # snapshot the containers first, writers may change them meanwhile
+        if ids is None:
+            source = list(self.movies.values())
+        else:
+            source = [movie for movie in map(self.movies.get, tuple(ids)) if movie is not None]
+        return select_page(source, key, descending, limit, after)
     
     
     def  list_movies(self) -> list[dict]:
         """returns all movies in memory"""
-        return list(self.movies.values())
+        return [movie.to_dict() for movie in list(self.movies.values())]
+    
+    def iter_movies(self, batch_size: int = 500) -> Iterator[dict]:
+        """Yields every movie ordered by id without copying the catalog
+            Walks the sorted id list in batches, so movies added or deleted
+            while iterating do not break the iteration
+        """
+        last_id = 0
+        while True:
+            start = bisect_right(self.indexes.ids, last_id)
+            batch = self.indexes.ids[start:start + batch_size]
+            if not batch:
+                return
+            for movie_id in batch:
+                movie = self.movies.get(movie_id)
+                if movie is not None:
+                    yield movie.to_dict()
+            last_id = batch[-1]
     
     def get_movie(self,movie_id: int) -> Optional[dict]:
         """Returns a movie by id if found else None"""
-        return self.movies.get(movie_id)
+        movie = self.movies.get(movie_id)
+        return movie.to_dict() if movie is not None else None
     
     def get_movie_by_year(self, year:int)-> List[dict]:
         """Returns a list of movies released in a given year"""
-        return [movie for movie in self.movies.values() if movie.get("year") == year]
+        return self._movies_for(self.indexes.by_year.get(year))
     
     def get_movie_by_director(self,director:str) -> List[dict]:
         """Returns a list of movies by a given director"""
-        return [movie for movie in self.movies.values() if movie.get("director","").lower() == director.lower()]
+        return self._movies_for(self.indexes.by_director.get(normalize_key(director)))
 
     def get_movies_by_genre(self, genre:str)-> List[dict]:
         """Returns a list of movies by a given genre"""
-        return [movie for movie in self.movies.values() if movie.get("genre","").lower() == genre.lower()]
+        return self._movies_for(self.indexes.by_genre.get(normalize_key(genre)))
     
 if __name__ == "__main__":
     p2 = ensure_db_file_exists()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Sequence
+from records import MOVIE_FIELDS, MovieRecord
+from search_index import InvertedIndex, TrigramIndex
+from stats import GROUP_FIELDS, SUMMARY_FIELDS, CatalogStats
+from storage import make_sort_key
+
+
+# Numeric fields with a sorted index, used by range filters and sorting
+SORTED_FIELDS = ("year", "rating", "price")
+# Fields with a hash index, key -> set of movie ids
+BUCKET_FIELDS = ("year", "director", "genre", "is_watched")
+# Fields the catalog aggregates depend on
+STATS_FIELDS = GROUP_FIELDS + SUMMARY_FIELDS + ("is_watched",)
+
+
+def normalize_key(value) -> str:
+    """Normalizes a text value used as index key (case insensitive)"""
+    return str(value).strip().casefold()
+
+
+class CatalogIndexes:
+    """Secondary indexes of the catalog, maintained with add/remove
+        Plain containers only, so the whole object can be pickled into
+        the sidecar file next to the snapshot
+        Writers must be serialized by the caller
+    """
+    def __init__(self, search_fields: Sequence[str] = ("title",)):
+        # key -> set of movie ids
+        self.by_year: Dict[int, set] = {}
+        self.by_director: Dict[str, set] = {}
+        self.by_genre: Dict[str, set] = {}
+        self.by_watched: Dict[bool, set] = {True: set(), False: set()}
+        # sorted make_sort_key tuples, (True, value, id) or (False, 0, id)
+        self.sorted: Dict[str, List[tuple]] = {field: [] for field in SORTED_FIELDS}
+        # every movie id in ascending order, used for keyset pagination
+        self.ids: List[int] = []
+        # full text index over the search fields
+        self.search = InvertedIndex(search_fields)
+        # trigrams of the title and director words, for fuzzy search
+        self.fuzzy = TrigramIndex()
+        # running aggregates behind catalog_stats
+        self.stats = CatalogStats()
+
+    @classmethod
+    def build(cls, movies: Iterable[MovieRecord], search_fields: Sequence[str] = ("title",)) -> "CatalogIndexes":
+        """Builds the indexes of a set of movies"""
+        indexes = cls(search_fields)
+        movies = list(movies)
+        for movie in movies:
+            indexes.add(movie, sorted_indexes=False)
+        indexes.sorted = {field: sorted(map(make_sort_key(field), movies)) for field in SORTED_FIELDS}
+        indexes.ids = sorted(movie.id for movie in movies)
+        return indexes
+
+    def _bucket_index(self, field: str) -> dict:
+        return {"year": self.by_year, "director": self.by_director, "genre": self.by_genre,
+                "is_watched": self.by_watched}[field]
+
+    @staticmethod
+    def _bucket_key(field: str, movie: MovieRecord):
+        """Returns the bucket of a movie in a hash index, None for none"""
+        value = movie.get(field)
+        if field == "is_watched":
+            return bool(value)
+        if field == "year":
+            return value
+        return normalize_key(value) if value else None
+
+    def _add_bucket(self, field: str, movie: MovieRecord) -> None:
+        key = self._bucket_key(field, movie)
+        if key is not None:
+            self._bucket_index(field).setdefault(key, set()).add(movie["id"])
+
+    def _remove_bucket(self, field: str, movie: MovieRecord) -> None:
+        """Removes a movie id from its bucket, dropping empty buckets
+            (the two watched buckets always exist)
+        """
+        index = self._bucket_index(field)
+        key = self._bucket_key(field, movie)
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.discard(movie["id"])
+        if not bucket and field != "is_watched":
+            del index[key]
+
+    def _remove_sorted(self, field: str, movie: MovieRecord) -> None:
+        keys = self.sorted[field]
+        key = make_sort_key(field)(movie)
+        pos = bisect_left(keys, key)
+        if pos < len(keys) and keys[pos] == key:
+            del keys[pos]
+
+    def add(self, movie: MovieRecord, sorted_indexes: bool = True) -> None:
+        """Adds a movie id to the year, director, genre and watched buckets
+            and to the sorted indexes
+        """
+        for field in BUCKET_FIELDS:
+            self._add_bucket(field, movie)
+        if sorted_indexes:
+            for field in SORTED_FIELDS:
+                insort(self.sorted[field], make_sort_key(field)(movie))
+        self.search.add(movie)
+        self.fuzzy.add(movie)
+        self.stats.add(movie)
+
+    def remove(self, movie: MovieRecord) -> None:
+        """Removes a movie id from its buckets, dropping empty buckets"""
+        for field in BUCKET_FIELDS:
+            self._remove_bucket(field, movie)
+        for field in SORTED_FIELDS:
+            self._remove_sorted(field, movie)
+        self.search.remove(movie)
+        self.fuzzy.remove(movie)
+        self.stats.remove(movie)
+
+    def update(self, previous: MovieRecord, current: MovieRecord) -> None:
+        """Moves a movie to its new version, only the indexes of the
+            fields that changed are touched (an is_watched flip leaves the
+            sorted and text indexes alone)
+        """
+        changed = {field for field in MOVIE_FIELDS if previous.get(field) != current.get(field)}
+        if not changed:
+            return
+        for field in BUCKET_FIELDS:
+            if field in changed:
+                self._remove_bucket(field, previous)
+                self._add_bucket(field, current)
+        for field in SORTED_FIELDS:
+            if field in changed:
+                self._remove_sorted(field, previous)
+                insort(self.sorted[field], make_sort_key(field)(current))
+        for text_index in (self.search, self.fuzzy):
+            if not changed.isdisjoint(text_index.fields):
+                text_index.remove(previous)
+                text_index.add(current)
+        if not changed.isdisjoint(STATS_FIELDS):
+            self.stats.remove(previous)
+            self.stats.add(current)
+
+    def add_id(self, movie_id: int) -> None:
+        """Adds a new movie id to the sorted id list"""
+        insort(self.ids, movie_id)
+
+    def remove_id(self, movie_id: int) -> None:
+        """Removes a movie id from the sorted id list"""
+        pos = bisect_left(self.ids, movie_id)
+        if pos < len(self.ids) and self.ids[pos] == movie_id:
+            del self.ids[pos]
+
+    def apply(self, previous, current) -> None:
+        """Moves a movie from its previous to its current version, None
+            meaning added or deleted
+        """
+        if previous is not None and current is not None:
+            self.update(previous, current)
+        elif previous is not None:
+            self.remove(previous)
+            self.remove_id(previous.id)
+        elif current is not None:
+            self.add(current)
+            self.add_id(current.id)
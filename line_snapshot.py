@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+import heapq
+import json
+import mmap
+import os
+import pickle
+import threading
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from records import MovieRecord, encode_movie
+
+
+# Line-oriented snapshot: a header line then one compact JSON movie per
+# line ordered by id, so a movie can be decoded alone from its offset
+LINES_FORMAT = "lines"
+# Version of the pickled sidecars (offsets, CatalogIndexes), part of their
+# identity: bump it when their content changes shape so old ones are rebuilt
+SIDECAR_FORMAT = 2
+
+
+def read_header(path: Path) -> Optional[dict]:
+    """Returns the header of a line-oriented snapshot, None for the
+        classic indented movies.json (its first line is just "{")
+    """
+    with path.open("rb") as data:
+        first = data.readline()
+    try:
+        header = json.loads(first)
+    except ValueError:
+        return None
+    return header if isinstance(header, dict) and header.get("format") == LINES_FORMAT else None
+
+
+def encoded_items(movies: Iterable[MovieRecord]) -> Iterator[Tuple[int, bytes]]:
+    """Returns the (id, JSON) pairs of movies ordered by id"""
+    return ((movie.id, encode_movie(movie.to_dict())) for movie in sorted(movies, key=lambda movie: movie.id))
+
+
+def write_lines(file, items: Iterable[Tuple[int, bytes]], next_id: int, version: int) -> Tuple[array, array]:
+    """Writes a line-oriented snapshot to an open binary file from
+        (id, JSON) pairs ordered by id
+        Returns the ids and the offset of each line, plus the end offset
+    """
+    header = {"format": LINES_FORMAT, "next_id": next_id, "version": version}
+    offset = file.write(json.dumps(header).encode("utf-8") + b"\n")
+    ids, offsets = array("q"), array("q")
+    for movie_id, encoded in items:
+        ids.append(movie_id)
+        offsets.append(offset)
+        offset += file.write(encoded + b"\n")
+    offsets.append(offset)
+    return ids, offsets
+
+
+def scan_lines(path: Path) -> Tuple[array, array]:
+    """Rebuilds the ids and offsets of a snapshot by reading it once"""
+    ids, offsets = array("q"), array("q")
+    with path.open("rb") as data:
+        offset = len(data.readline())
+        for line in data:
+            if line.strip():
+                ids.append(json.loads(line)["id"])
+                offsets.append(offset)
+            offset += len(line)
+    offsets.append(offset)
+    return ids, offsets
+
+
+def snapshot_identity(path: Path, version: int) -> Tuple[int, int, int, int]:
+    """Identifies a snapshot file and the sidecar format, sidecars built
+        for another snapshot or by another format are stale
+    """
+    stat = os.stat(path)
+    return (SIDECAR_FORMAT, version, stat.st_size, stat.st_mtime_ns)
+
+
+def write_sidecar(path: Path, identity: Tuple[int, int, int, int], payload) -> None:
+    """Pickles data derived from a snapshot next to it (temp file + replace)"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as sidecar:
+        pickle.dump((identity, payload), sidecar, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_sidecar(path: Path, identity: Tuple[int, int, int, int]):
+    """Returns the payload of a sidecar if it belongs to the snapshot"""
+    try:
+        with path.open("rb") as sidecar:
+            sidecar_identity, payload = pickle.load(sidecar)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[line_snapshot.read_sidecar] ignoring unreadable {path.name}: {e}")
+        return None
+    return payload if sidecar_identity == identity else None
+
+
+class LazyMovies:
+    """Mapping of movie id to MovieRecord over a memory mapped snapshot
+        Records are decoded the first time they are read and kept, changes
+        go to overlay dicts and deleted snapshot ids are remembered, so
+        the snapshot itself is never modified
+        Offers the subset of the dict interface used by MovieDatabase
+        A compaction reopens it on the new snapshot (reopen), the overlays
+        then only keep the changes made after the snapshot was copied
+    """
+    def __init__(self, path: Path, ids: array, offsets: array):
+        self._path = path
+        self._data = self._map(path)
+        self._ids = ids
+        self._offsets = offsets
+        self._loaded: Dict[int, MovieRecord] = {} # decoded or updated snapshot movies
+        self._updated: set = set() # snapshot movies changed since
+        self._added: Dict[int, MovieRecord] = {} # movies not in the snapshot
+        self._deleted: set = set()
+        self._count: int = len(ids)
+        # a decode must not bring back a movie deleted meanwhile
+        self._lock = threading.Lock()
+        # set by reopen, readers still holding this one decode from it
+        self._successor: Optional["LazyMovies"] = None
+
+    @staticmethod
+    def _map(path: Path) -> mmap.mmap:
+        with path.open("rb") as data:
+            return mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _position(self, movie_id: int) -> int:
+        """Index of a movie in the snapshot, -1 if not there"""
+        pos = bisect_left(self._ids, movie_id)
+        return pos if pos < len(self._ids) and self._ids[pos] == movie_id else -1
+
+    def get(self, movie_id: int, default=None) -> Optional[MovieRecord]:
+        movie = self._loaded.get(movie_id) or self._added.get(movie_id)
+        if movie is not None:
+            return movie
+        pos = self._position(movie_id) if isinstance(movie_id, int) else -1
+        if pos < 0:
+            return default
+        with self._lock:
+            if self._successor is not None: # the mapping was closed by reopen
+                return self._successor.get(movie_id, default)
+            raw = self._data[self._offsets[pos]:self._offsets[pos + 1]]
+        movie = MovieRecord.from_dict(json.loads(raw))
+        with self._lock:
+            if movie_id in self._deleted:
+                return default
+            return self._loaded.setdefault(movie_id, movie)
+
+    def __getitem__(self, movie_id: int) -> MovieRecord:
+        movie = self.get(movie_id)
+        if movie is None:
+            raise KeyError(movie_id)
+        return movie
+
+    def __contains__(self, movie_id) -> bool:
+        return self.get(movie_id) is not None
+
+    def __setitem__(self, movie_id: int, movie: MovieRecord) -> None:
+        with self._lock:
+            if self._position(movie_id) >= 0:
+                self._count += movie_id in self._deleted
+                self._deleted.discard(movie_id)
+                self._updated.add(movie_id)
+                self._loaded[movie_id] = movie
+            else:
+                self._count += movie_id not in self._added
+                self._added[movie_id] = movie
+
+    def pop(self, movie_id: int, default=None) -> Optional[MovieRecord]:
+        movie = self.get(movie_id)
+        if movie is None:
+            return default
+        with self._lock:
+            if movie_id in self._added:
+                del self._added[movie_id]
+            else:
+                self._loaded.pop(movie_id, None)
+                self._updated.discard(movie_id)
+                self._deleted.add(movie_id)
+            self._count -= 1
+        return movie
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        deleted = self._deleted
+        for movie_id in self._ids:
+            if movie_id not in deleted:
+                yield movie_id
+        yield from list(self._added)
+
+    def keys(self) -> Iterator[int]:
+        return iter(self)
+
+    def values(self) -> List[MovieRecord]:
+        """Decodes every movie, O(n): only for full scans and snapshots"""
+        movies = [self.get(movie_id) for movie_id in self._ids if movie_id not in self._deleted]
+        return [movie for movie in movies if movie is not None] + list(self._added.values())
+
+    def changes(self) -> Tuple[Dict[int, MovieRecord], Dict[int, MovieRecord], set]:
+        """Copies the changes (updated, added, deleted), call it under the
+            writer lock
+        """
+        with self._lock:
+            return ({movie_id: self._loaded[movie_id] for movie_id in self._updated}, dict(self._added),
+                    set(self._deleted))
+
+    def encoded_items(self, changes: Optional[tuple] = None) -> Iterator[Tuple[int, bytes]]:
+        """Returns the (id, JSON) pairs of the movies with changes applied
+            (default: the current ones, copied now) ordered by id
+            Unchanged movies are copied raw from the snapshot while
+            iterating, without decoding them
+        """
+        loaded, added, deleted = changes if changes is not None else self.changes()
+        added = sorted(added.items())
+        data, ids, offsets = self._data, self._ids, self._offsets
+        def snapshot_items() -> Iterator[Tuple[int, bytes]]:
+            for pos, movie_id in enumerate(ids):
+                if movie_id in deleted:
+                    continue
+                movie = loaded.get(movie_id)
+                if movie is not None:
+                    yield movie_id, encode_movie(movie.to_dict())
+                else:
+                    yield movie_id, data[offsets[pos]:offsets[pos + 1]].rstrip(b"\n")
+        return heapq.merge(snapshot_items(), ((movie_id, encode_movie(movie.to_dict())) for movie_id, movie in added),
+                           key=lambda item: item[0])
+
+    def reopen(self, replace: Callable[[], None], ids: array, offsets: array, changes: tuple) -> "LazyMovies":
+        """Closes the mapping, calls replace to swap in the snapshot written
+            from changes (see encoded_items) and returns a LazyMovies over
+            it holding the changes made since, call it under the writer lock
+            The mapping is closed first, Windows cannot replace a mapped file
+        """
+        updated, added, deleted = changes
+        with self._lock:
+            self._data.close()
+            try:
+                replace()
+            except BaseException:
+                self._data = self._map(self._path)
+                raise
+            movies = LazyMovies(self._path, ids, offsets)
+            for movie_id in self._updated | self._added.keys() | self._deleted | updated.keys() | added.keys() | deleted:
+                if movie_id in self._updated:
+                    current = self._loaded[movie_id]
+                else:
+                    # None once deleted, wherever it was
+                    current = self._added.get(movie_id)
+                written = updated.get(movie_id) or added.get(movie_id)
+                if current is written and (current is not None or movie_id in deleted):
+                    continue
+                if current is None:
+                    movies.pop(movie_id)
+                else:
+                    movies[movie_id] = current
+            self._successor = movies
+        return movies
@@ -1,15 +1,217 @@
+import time
+from typing import Optional
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.dependencies.utils import get_flat_dependant
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
+from starlette.routing import Match
 from config import settings
 from models import MovieCreate
 from models import ErrorResponse
+from cache import CachedResponse, ResponseCache, etag_matches, make_etag, variant_etag
+from negotiation import VARY, ContentNegotiator, FastJSONResponse
+from storage import NotDurable
+from profiler import SlowRequestProfiler
+import metrics
 import movies
 #creating instance of FastAPI
 #Step 13 adding settings to FastAPI instance
 # Step 20 Add POST endpoint in main.py
-app = FastAPI(title="Movie Catalog API", version="1.0.0", description="API for managing a basic movie catalog", debug=settings.debug)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Flushes pending catalog writes when the server stops"""
+    yield
+    movies.db.close()
+    if profiler is not None:
+        profiler.stop()
+
+app = FastAPI(title="Movie Catalog API", version="1.0.0", description="API for managing a basic movie catalog", debug=settings.debug, lifespan=lifespan,
+              default_response_class=FastJSONResponse)
+
+#Response cache in front of the movies router
+response_cache = ResponseCache(settings.response_cache_size, settings.response_cache_max_bytes,
+                               settings.response_cache_max_entry_bytes)
+CACHED_PATH_PREFIX = "/api/v1/movies"
+
+def match_route(request: Request):
+    """Returns the route serving a request, None if no route matches"""
+    route = request.scope.get("route")
+    if route is None:
+        # answered before routing (response cache), match it here
+        for candidate in app.router.routes:
+            if candidate.matches(request.scope)[0] == Match.FULL:
+                return candidate
+    return route
+
+# route unique_id -> names of the query parameters it declares
+_route_query_params = {}
+
+def cache_key(request: Request) -> Optional[tuple]:
+    """Returns the response cache key of a request: path and the query
+        parameters the route declares, others (?x=1) do not change the
+        response so they do not make new entries. None if no route matches
+    """
+    route = match_route(request)
+    if getattr(route, "dependant", None) is None:
+        return None
+    names = _route_query_params.get(route.unique_id)
+    if names is None:
+        names = _route_query_params[route.unique_id] = frozenset(
+            param.alias for param in get_flat_dependant(route.dependant).query_params)
+    # repeated parameters keep their order
+    params = sorted(((name, value) for name, value in request.query_params.multi_items() if name in names),
+                    key=lambda item: item[0])
+    return request.url.path, tuple(params)
+
+@app.middleware("http")
+async def cache_responses(request: Request, call_next):
+    """Serves repeated GETs of the catalog from pre-serialized bytes
+        Responses carry a strong ETag, If-None-Match answers 304
+    """
+    if not settings.response_cache_enabled or request.method != "GET" or not request.url.path.startswith(CACHED_PATH_PREFIX):
+        return await call_next(request)
+    key = cache_key(request)
+    if key is None:
+        return await call_next(request)
+    if_none_match = request.headers.get("if-none-match")
+    entry = response_cache.get(key, movies.db.version)
+    if entry is None:
+        version = movies.db.version
+        response = await call_next(request)
+        # only JSON bodies are cached, streams (export) pass through
+        if response.status_code != 200 or response.headers.get("content-type") != "application/json":
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        entry = CachedResponse(version, make_etag(body), body, "application/json", {})
+        response_cache.put(key, entry)
+    # the representation picked by negotiate_content is built once per entry
+    representation = request.state.representation
+    variant = entry.variants.get(representation)
+    if variant is None:
+        body, media_type, encoding = negotiator.encode(entry.body, entry.media_type, representation)
+        etag = variant_etag(entry.etag, "msgpack" if media_type != entry.media_type else None, encoding)
+        variant = (etag, body, media_type, encoding)
+        response_cache.add_variant(key, entry, representation, variant)
+    etag, body, media_type, encoding = variant
+    request.state.negotiated = True
+    headers = {"ETag":etag, "Vary":VARY}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+#Registered after the cache so it runs first: other workers may have changed the catalog
+@app.middleware("http")
+async def refresh_storage(request: Request, call_next):
+    """Applies the catalog changes written by other worker processes
+        In the threadpool: refresh takes the file lock, held by the writes
+        of this and the other workers
+    """
+    if request.url.path.startswith(CACHED_PATH_PREFIX):
+        await run_in_threadpool(movies.db.refresh)
+    return await call_next(request)
+
+#Content negotiation, outside the cache which keeps the encoded bodies
+negotiator = ContentNegotiator(settings.compression_min_size, settings.gzip_level, settings.brotli_quality,
+                               settings.compression_enabled, settings.msgpack_enabled)
+
+@app.middleware("http")
+async def negotiate_content(request: Request, call_next):
+    """Sends JSON bodies as MessagePack to clients asking for it and
+        compresses large bodies with the best coding the client accepts
+        Event streams are left alone, they must not be buffered
+    """
+    representation = request.state.representation = negotiator.choose(request.headers.get("accept"),
+                                                                      request.headers.get("accept-encoding"))
+    request.state.negotiated = False
+    response = await call_next(request)
+    content_type = response.headers.get("content-type")
+    if (request.state.negotiated or "content-encoding" in response.headers or not negotiator.negotiable(content_type)
+            or response.status_code in (status.HTTP_204_NO_CONTENT, status.HTTP_304_NOT_MODIFIED)):
+        return response
+    response.headers["Vary"] = VARY
+    if negotiator.streamed(content_type):
+        if representation.encoding is not None:
+            response.body_iterator = negotiator.encode_stream(response.body_iterator, representation.encoding)
+            response.headers["Content-Encoding"] = representation.encoding
+            if "content-length" in response.headers:
+                del response.headers["content-length"]
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    body, media_type, encoding = negotiator.encode(body, content_type, representation)
+    headers = {name: value for name, value in response.headers.items() if name not in ("content-length", "content-type")}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=response.status_code, media_type=media_type, headers=headers)
+
+#Sampling profiler of slow requests, only running when enabled
+profiler = (SlowRequestProfiler(settings.profiler_interval_ms, settings.profiler_slow_ms, settings.profiler_keep)
+            if settings.profiler_enabled else None)
+
+def route_label(request: Request) -> str:
+    """Returns the path template of the route serving a request, raw
+        paths would give one time series per movie id
+    """
+    return getattr(match_route(request), "path", "<unmatched>")
+
+#Registered last so it runs first and also times the other middlewares
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """Records per route latency, status, response size and in-flight
+        requests, and hands slow requests to the profiler
+    """
+    if not settings.metrics_enabled:
+        return await call_next(request)
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    profile_start = profiler.begin() if profiler is not None else None
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        duration = time.perf_counter() - start
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        method, route = request.method, route_label(request)
+        metrics.REQUESTS.inc(method=method, route=route, status=status_code)
+        metrics.REQUEST_DURATION.observe(duration, method=method, route=route)
+        if profile_start is not None:
+            profiler.end(profile_start, method, route)
+    length = response.headers.get("content-length")
+    if length is not None:
+        metrics.RESPONSE_SIZE.observe(int(length), method=method, route=route)
+    else:
+        response.body_iterator = measure_body(response.body_iterator, method, route)
+    return response
+
+async def measure_body(body, method: str, route: str):
+    """Passes a streamed body through, then records its size"""
+    size = 0
+    async for chunk in body:
+        size += len(chunk)
+        yield chunk
+    metrics.RESPONSE_SIZE.observe(size, method=method, route=route)
+
+#Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Returns the request and storage metrics in the Prometheus text format"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/profiles", include_in_schema=False)
+def get_profiles():
+    """Returns the stack profiles of the last slow requests"""
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="The profiler is disabled, set PROFILER_ENABLED=true")
+    profiles = profiler.summary()
+    return {"success":True, "message":f"{len(profiles)} slow requests profiled", "data":profiles}
 
 #defininf main endpoint
 #Step 13 updating the name frome read_root to root and use async function
@@ -51,6 +253,14 @@ def http_exception_handler(request: Request, exc: HTTPException):
     
 
     
+@app.exception_handler(NotDurable)
+def not_durable_exception_handler(request: Request, exc: NotDurable):
+    """A durable write could not be confirmed on disk, the client may retry"""
+    return JSONResponse(
+        status_code= status.HTTP_503_SERVICE_UNAVAILABLE,
+        content = ErrorResponse(status_code= status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc),error_type="Storage Unavailable").model_dump()
+    )
+
 @app.exception_handler(Exception)
 def general_exception_handler(request: Request, exc: Exception):
     """Custom handler for general exceptions"""
@@ -81,6 +81,7 @@ class MovieListResponse(BaseModel):
     message: str = Field(..., description  = "Message to the client")
     data: List[dict] = Field(default_factory= list, description = "List of returned movies or None if not applicable")
     total: int = Field(..., description = "Total number of movies returned")
+    next_cursor: Optional[str] = Field(None, description = "Cursor to request the next page, None on the last page")
     
 class ErrorResponse(BaseModel):
     """Class model for error responses from the API """  
@@ -94,6 +95,73 @@ class MovieCreate(MovieBase):
     pass
 
 
+class BulkRowResult(BaseModel):
+    """Result of importing one row of a bulk request"""
+    row: int = Field(..., description = "Position of the row in the request, starting at 0")
+    success: bool = Field(..., description = "States if the row was imported")
+    id: Optional[int] = Field(None, description = "Id assigned to the imported movie")
+    error: Optional[str] = Field(None, description = "Why the row was rejected")
+
+
+class BulkImportResponse(BaseModel):
+    """Class for the per row report of a bulk import"""
+    success: bool = Field(..., description = "States if every row was imported")
+    message: str = Field(..., description  = "Message to the client")
+    created: int = Field(..., description = "Number of movies imported")
+    failed: int = Field(..., description = "Number of rows rejected")
+    results: List[BulkRowResult] = Field(default_factory= list, description = "Result of each row")
+
+
+class StatsResponse(BaseModel):
+    """Model for the catalog statistics response"""
+    success: bool = Field(..., description = "States if  the API call was successful")
+    message: str = Field(..., description  = "Message to the client")
+    data: dict = Field(..., description = "Overall aggregates and, when grouped, one entry per group")
+
+
+class MovieFilter(BaseModel):
+    """Filter selecting the movies of a batch operation, every given field must match"""
+    year: Optional[int] = Field(None, description = "Release year")
+    year_min: Optional[int] = Field(None, description = "Released in or after this year")
+    year_max: Optional[int] = Field(None, description = "Released in or before this year")
+    rating_min: Optional[float] = Field(None, description = "Minimum rating")
+    rating_max: Optional[float] = Field(None, description = "Maximum rating")
+    price_min: Optional[float] = Field(None, description = "Minimum price")
+    price_max: Optional[float] = Field(None, description = "Maximum price")
+    director: Optional[str] = Field(None, description = "Director, case insensitive")
+    genre: Optional[str] = Field(None, description = "Genre, case insensitive")
+    is_watched: Optional[bool] = Field(None, description = "Watched status")
+
+
+class BatchDeleteRequest(BaseModel):
+    """Movies selected by ids, by a filter or both (ids matching the filter)"""
+    ids: Optional[List[int]] = Field(None, min_length = 1, description = "Ids of the movies")
+    filter: Optional[MovieFilter] = Field(None, description = "Filter on the movie fields")
+
+
+class BatchUpdateRequest(BatchDeleteRequest):
+    """Partial update applied to every selected movie"""
+    patch: MovieUpdate = Field(..., description = "Fields to change, the others are kept")
+
+
+class BatchResponse(BaseModel):
+    """Class for the result of a batch update or delete"""
+    success: bool = Field(..., description = "States if  the API call was successful")
+    message: str = Field(..., description  = "Message to the client")
+    count: int = Field(..., description = "Number of movies changed")
+    ids: List[int] = Field(default_factory= list, description = "Ids of the movies changed")
+    missing: List[int] = Field(default_factory= list, description = "Requested ids not found or not matching the filter")
+    replayed: bool = Field(False, description = "True when the idempotency key was already applied, nothing changed again")
+
+
+class ChangesResponse(BaseModel):
+    """Class for one page of the catalog change feed"""
+    success: bool = Field(..., description = "States if  the API call was successful")
+    message: str = Field(..., description  = "Message to the client")
+    data: List[dict] = Field(default_factory= list, description = "Changes oldest first: seq, type (created, updated, deleted), id and movie")
+    last_seq: int = Field(..., description = "Sequence to pass as since on the next call")
+    has_more: bool = Field(False, description = "More changes are available right away")
+
 
 #step 19 test the validators for year and title
 if __name__ == "__main__":
@@ -103,4 +171,4 @@ if __name__ == "__main__":
     year=2031,
     genre="Sci-Fi"
     )
-    print(movie.model_dump())
\ No newline at end of file
+    print(movie.model_dump())
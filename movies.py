@@ -1,28 +1,130 @@
-from fastapi import APIRouter, HTTPException
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 from database import MovieDatabase
 from models import MovieCreate
 from models import MovieUpdate
 from models import MovieResponse
 from models import MovieListResponse
 from models import ErrorResponse
+from models import BulkImportResponse
+from models import StatsResponse
+from models import BatchDeleteRequest, BatchUpdateRequest, BatchResponse
+from models import ChangesResponse
+from change_feed import ChangesExpired
+from config import settings
+from records import dumps_json
+from pagination import decode_cursor, encode_cursor, parse_fields, project
+from storage import IdempotencyConflict, MovieStorage, parse_sort
 
 
 #Step 30 Add GET endpoint to list movies
 #Creating router instance
 router = APIRouter(tags=["Movies"])
 #Creating database instance
-db = MovieDatabase()
+def create_storage() -> MovieStorage:
+    """Creates the storage backend selected by settings.storage_backend"""
+    if settings.storage_backend == "sqlite":
+        from sqldb.sqlite_backend import SqliteMovieStorage
+        return SqliteMovieStorage(search_fields=settings.search_fields)
+    if settings.storage_backend != "json":
+        raise ValueError(f"Unknown storage backend : {settings.storage_backend}")
+    return MovieDatabase(file_path=settings.database_file, snapshot_format=settings.snapshot_format,
+                         journal=settings.journal_enabled, compact_threshold=settings.journal_compact_threshold,
+                         search_fields=settings.search_fields, group_commit=settings.group_commit,
+                         flush_interval_ms=settings.flush_interval_ms, flush_max_pending=settings.flush_max_pending,
+                         durable_timeout_ms=settings.durable_timeout_ms,
+                         shared=settings.shared_storage, change_feed_size=settings.change_feed_size)
+
+db: MovieStorage = create_storage()
+
+#Write endpoints return once the change is in memory unless durable=true
+DURABLE_QUERY = Query(False, description="Wait until the change is flushed to disk before responding")
+
+
+def page_params(
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of movies to return"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor returned as next_cursor by the previous page"),
+    sort: Optional[str] = Query(None, description="Sort field, prefix with - for descending (e.g. -rating)"),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return (e.g. id,title)"),
+) -> dict:
+    """Common pagination and projection query parameters of list endpoints"""
+    return {"limit": limit, "cursor": cursor, "sort": sort, "fields": fields}
+
+
+def page_query(params: dict, default_sort: str = "id") -> Tuple[str, Optional[List[str]], Optional[tuple]]:
+    """Validates the page parameters, returns (sort, fields, after)"""
+    sort = params["sort"] or default_sort
+    try:
+        parse_sort(sort)
+        fields = parse_fields(params["fields"])
+        after = decode_cursor(params["cursor"], sort) if params["cursor"] else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return sort, fields, after
+
+
+def list_response(message: str, total: int, page: List[dict], last_key: Optional[tuple],
+                  sort: str, fields: Optional[List[str]]) -> dict:
+    """Builds a MovieListResponse body for one page of movies"""
+    return {
+        "success":True,
+        "message":message,
+        "data":[project(movie, fields) for movie in page],
+        "total":total,
+        "next_cursor":encode_cursor(sort, last_key) if last_key is not None else None
+    }
+
+
+def encoded_list_response(message: str, total: int, page: List[bytes], last_key: Optional[tuple], sort: str) -> Response:
+    """Joins the JSON fragments of a page into a MovieListResponse body
+        The movies were validated when stored, so the response model
+        validation and jsonable_encoder are skipped
+    """
+    next_cursor = encode_cursor(sort, last_key) if last_key is not None else None
+    body = b"".join((b'{"success":true,"message":', json.dumps(message, ensure_ascii=False).encode("utf-8"),
+                     b',"data":[', b",".join(page), b'],"total":', str(total).encode(),
+                     b',"next_cursor":', json.dumps(next_cursor).encode(), b"}"))
+    return Response(content=body, media_type="application/json")
+
+
+def list_page(params: dict, message: Callable[[int], str], not_found: Optional[str] = None,
+              search: Optional[str] = None, fuzzy: bool = False, **filters) -> Union[dict, Response]:
+    """Returns one page of the filtered movies, or of a text search
+        (typo tolerant with fuzzy)
+        Raises 404 with not_found when nothing matches, if given
+        With settings.fast_responses and no fields projection the body is
+        built from the JSON fragments cached on the stored movies
+    """
+    sort, fields, after = page_query(params, default_sort="id" if search is None else "relevance")
+    encoded = settings.fast_responses and fields is None
+    if search is None:
+        page, last_key, total = db.query_movies(sort=sort, limit=params["limit"], after=after, encoded=encoded, **filters)
+    else:
+        try:
+            page, last_key, total = db.search_page(search, sort=sort, limit=params["limit"], after=after,
+                                                   encoded=encoded, fuzzy=fuzzy)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if total ==0 and not_found is not None:
+        raise HTTPException(status_code=404, detail=not_found)
+    if encoded:
+        return encoded_list_response(message(total), total, page, last_key, sort)
+    return list_response(message(total), total, page, last_key, sort, fields)
 
 
 #Step 39 Add endpoint to create a new movie
 @router.post("/movies",status_code = 201, response_model= MovieResponse)
-def create_movie(movie: MovieCreate):
+def create_movie(movie: MovieCreate, durable: bool = DURABLE_QUERY):
     """Endpoint to create a new movie entry and store it in the database"""
     #Validation required fields
     data = movie.model_dump()
     
-    created = db.add_movie(data)
-    db.save_data()
+    created = db.add_movie(data, durable=durable)
 
     return {
         "success":True,
@@ -30,73 +132,334 @@ def create_movie(movie: MovieCreate):
         "data":created
     }
 
+
+#Validates a whole batch of rows in one call
+movie_list_adapter = TypeAdapter(List[MovieCreate])
+
+
+def validate_batch(rows: List[Tuple[int, object]], results: List[dict]) -> List[Tuple[int, dict]]:
+    """Validates a batch of (row, payload), returns the valid rows as dicts
+        Rejected rows are reported in results
+    """
+    try:
+        movies = movie_list_adapter.validate_python([payload for _, payload in rows])
+    except ValidationError as e:
+        errors: Dict[int, str] = {}
+        for error in e.errors():
+            position = error["loc"][0]
+            field = ".".join(str(part) for part in error["loc"][1:])
+            message = f"{field}: {error['msg']}" if field else error["msg"]
+            errors[position] = f"{errors[position]}; {message}" if position in errors else message
+        for position, message in errors.items():
+            results.append({"row":rows[position][0], "success":False, "error":message})
+        rows = [row for position, row in enumerate(rows) if position not in errors]
+        if not rows:
+            return []
+        movies = movie_list_adapter.validate_python([payload for _, payload in rows])
+    return [(row, movie.model_dump()) for (row, _), movie in zip(rows, movies)]
+
+
+def validate_lines(lines: List[Tuple[int, bytes]], results: List[dict]) -> List[Tuple[int, dict]]:
+    """Parses and validates a batch of NDJSON (row, line), returns the
+        valid rows as dicts, rejected rows are reported in results
+    """
+    rows = []
+    for row, line in lines:
+        try:
+            rows.append((row, json.loads(line)))
+        except ValueError as e:
+            results.append({"row":row, "success":False, "error":f"Invalid JSON: {e}"})
+    return validate_batch(rows, results) if rows else []
+
+
+async def read_ndjson(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    """Yields (row, payload) from an NDJSON body as it is received"""
+    buffer = b""
+    row = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield row, line
+                row += 1
+    if buffer.strip():
+        yield row, buffer
+
+
+#Bulk import, accepts a JSON array or NDJSON (Content-Type: application/x-ndjson)
+@router.post("/movies/bulk", response_model= BulkImportResponse, responses={400: {"model": ErrorResponse}})
+async def bulk_create_movies(request: Request, durable: bool = DURABLE_QUERY):
+    """Endpoint to import many movies at once with a single persistence flush
+        The body is received here, parsing and validation (CPU bound) run
+        in the threadpool batch by batch so other requests are served
+    """
+    batch_size = settings.bulk_batch_size
+    results: List[dict] = []
+    valid: List[Tuple[int, dict]] = []
+    batch: List[Tuple[int, bytes]] = []
     
-#Adding endpoint to get list of movies by year with Path Parameter
-@router.get("/movies/{year}", response_model= MovieListResponse)
-async def get_movies_by_year(year: int):
-    """End point to get movies by release year"""
-    movies =db.get_movie_by_year(year)
-    if movies is None or len(movies) ==0:
-        raise HTTPException(status_code=404, detail=f"No movies found for year {year}")
+    if "ndjson" in request.headers.get("content-type", ""):
+        async for row, line in read_ndjson(request):
+            batch.append((row, line))
+            if len(batch) >= batch_size:
+                valid.extend(await run_in_threadpool(validate_lines, batch, results))
+                batch = []
+    else:
+        try:
+            payload = await run_in_threadpool(json.loads, await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        if not isinstance(payload, list):
+            raise HTTPException(status_code=400, detail="Bulk import expects a JSON array of movies")
+        for start in range(0, len(payload), batch_size):
+            valid.extend(await run_in_threadpool(validate_batch, list(enumerate(payload[start:start + batch_size], start)),
+                                                 results))
+    if batch:
+        valid.extend(await run_in_threadpool(validate_lines, batch, results))
+    
+    created = await run_in_threadpool(db.add_movies, [data for _, data in valid], durable)
+    results.extend({"row":row, "success":True, "id":movie["id"]} for (row, _), movie in zip(valid, created))
+    results.sort(key=lambda result: result["row"])
+    failed = len(results) - len(created)
+    return {
+        "success":failed == 0,
+        "message":f"{len(created)} movies imported, {failed} rows rejected",
+        "created":len(created),
+        "failed":failed,
+        "results":results
+    }
+
+
+#Retried batches with the same key are not applied twice
+IDEMPOTENCY_KEY_HEADER = Header(None, alias="Idempotency-Key", max_length=200,
+                                description="Client chosen key, a retry with the same key returns the first result")
+
+
+def run_batch(operation: Callable[..., dict], verb: str, selection: BatchDeleteRequest, key: Optional[str],
+              durable: bool, **arguments) -> dict:
+    """Runs a batch update or delete, returns a BatchResponse body
+        Raises 400 for an empty selection, 409 for a reused idempotency key
+    """
+    filters = selection.filter.model_dump(exclude_none=True) if selection.filter is not None else {}
+    if selection.ids is None and not filters:
+        raise HTTPException(status_code=400, detail="Give ids or a filter with at least one field")
+    try:
+        result = operation(ids=selection.ids, key=key, durable=durable, **arguments, **filters)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    replayed = " (already applied with this idempotency key)" if result["replayed"] else ""
+    return {
+        "success":True,
+        "message":f"{len(result['ids'])} movies {verb}{replayed}",
+        "count":len(result["ids"]),
+        **result
+    }
+
+#Batch routes must be registered before /movies/{movie_id}
+@router.patch("/movies/batch", response_model= BatchResponse, responses={400: {"model": ErrorResponse},409:{"model":ErrorResponse}})
+def update_movies_batch(payload: BatchUpdateRequest, durable: bool = DURABLE_QUERY,
+                        idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER):
+    """Endpoint to apply the same partial update to many movies at once
+        (e.g. {"filter": {"genre": "drama"}, "patch": {"price": 4.99}}),
+        applied atomically and persisted once
+    """
+    changes = payload.patch.model_dump(exclude_unset=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="The patch does not change any field")
+    return run_batch(db.update_movies, "updated", payload, idempotency_key, durable, changes=changes)
+
+@router.delete("/movies/batch", response_model= BatchResponse, responses={400: {"model": ErrorResponse},409:{"model":ErrorResponse}})
+def delete_movies_batch(payload: BatchDeleteRequest, durable: bool = DURABLE_QUERY,
+                        idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER):
+    """Endpoint to delete many movies at once by ids and/or filter,
+        applied atomically and persisted once
+    """
+    return run_batch(db.delete_movies, "deleted", payload, idempotency_key, durable)
+    
+#Sequence of the last change in the export, the change feed resumes from it
+CHANGE_SEQ_HEADER = "X-Change-Seq"
+
+#Export must be registered before /movies/{year} to be matched
+@router.get("/movies/export", response_class=StreamingResponse, responses={200: {"content": {"application/x-ndjson": {}}}})
+def export_movies(format: str = Query("ndjson", description="Export format, only ndjson is supported")):
+    """Streams the whole catalog, one JSON movie per line"""
+    if format != "ndjson":
+        raise HTTPException(status_code=400, detail=f"Unsupported export format : {format}")
+    def generate():
+        for movie in db.iter_movies():
+            yield dumps_json(movie) + b"\n"
+    headers = {"Content-Disposition":"attachment; filename=movies.ndjson"}
+    # taken before streaming: replaying the changes after it over the export
+    # is safe, every change event carries the whole movie
+    if db.change_seq is not None:
+        headers[CHANGE_SEQ_HEADER] = str(db.change_seq)
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=headers)
+
+#Change feed, clients too far behind (or ahead) get 410 and must re-sync from the export
+CHANGES_EXPIRED_DETAIL = ("Changes after {since} are not available, re-sync with /api/v1/movies/export "
+                          "and resume from its " + CHANGE_SEQ_HEADER + " header")
+# The stream checks for new changes every poll, and sends a comment when idle
+# for keepalive seconds so proxies do not close the connection
+STREAM_POLL_SECONDS = 0.25
+STREAM_KEEPALIVE_SECONDS = 15.0
+STREAM_PAGE_SIZE = 1000
+
+@router.get("/movies/changes", response_model= ChangesResponse, responses={400: {"model": ErrorResponse},410:{"model":ErrorResponse}})
+def get_changes(
+    since: int = Query(0, ge=0, description="Sequence of the last change already seen, last_seq of the previous page"),
+    limit: int = Query(1000, ge=1, le=10000, description="Maximum number of changes to return, a batch is never split"),
+):
+    """Endpoint to poll the created, updated and deleted movies after a
+        sequence, oldest first
+    """
+    try:
+        changes, last_seq, more = db.changes_since(since, limit)
+    except ChangesExpired:
+        raise HTTPException(status_code=410, detail=CHANGES_EXPIRED_DETAIL.format(since=since))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "success":True,
-        "message":f"{len(movies)} movies found for year {year}",
-        "data":movies,
-        "total": len(movies)
+        "message":f"{len(changes)} changes after {since}",
+        "data":changes,
+        "last_seq":last_seq,
+        "has_more":more
     }
+
+def sse_message(event: str, data: dict, id: Optional[int] = None) -> bytes:
+    """Formats one Server-Sent Events message"""
+    lines = [f"id: {id}"] if id is not None else []
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+@router.get("/movies/changes/stream", response_class=StreamingResponse, responses={200: {"content": {"text/event-stream": {}}}})
+async def stream_changes(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0, description="Sequence of the last change already seen, defaults to now"),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID", description="Set by EventSource when reconnecting"),
+):
+    """Endpoint to follow the changes as Server-Sent Events named created,
+        updated and deleted, a reset event tells the client to re-sync from
+        the export
+        The id of the last event of each change is its sequence, so a
+        reconnecting EventSource resumes after it
+    """
+    if db.change_seq is None:
+        raise HTTPException(status_code=400, detail="This storage backend has no change feed")
+    start = last_event_id if last_event_id is not None else since
+    async def generate():
+        seq = start if start is not None else db.change_seq
+        idle = 0.0
+        while not await request.is_disconnected():
+            # the refresh middleware only ran once, picks up the other workers' changes
+            await run_in_threadpool(db.refresh)
+            try:
+                changes, last_seq, more = await run_in_threadpool(db.changes_since, seq, STREAM_PAGE_SIZE)
+            except ChangesExpired:
+                yield sse_message("reset", {"detail": CHANGES_EXPIRED_DETAIL.format(since=seq),
+                                            "export": "/api/v1/movies/export"})
+                return
+            for position, change in enumerate(changes):
+                last = position + 1 == len(changes) or changes[position + 1]["seq"] != change["seq"]
+                yield sse_message(change["type"], change, change["seq"] if last else None)
+            seq = last_seq
+            if changes:
+                idle = 0.0
+            if more:
+                continue
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+            idle += STREAM_POLL_SECONDS
+            if idle >= STREAM_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield b": keepalive\n\n"
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control":"no-cache", "X-Accel-Buffering":"no"})
+
+#Catalog statistics, must also be registered before /movies/{year}
+@router.get("/movies/stats", response_model= StatsResponse, responses={400:{"model":ErrorResponse}})
+def get_catalog_stats(group_by: Optional[str] = Query(None, description="Group the statistics by genre, year or director")):
+    """Endpoint to get counts, watched ratio and rating/price/duration
+        summaries (count, total, average, min, max) of the catalog
+    """
+    try:
+        data = db.catalog_stats(group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    groups = f" in {len(data['groups'])} groups" if group_by else ""
+    return {
+        "success":True,
+        "message":f"Statistics of {data['overall']['count']} movies{groups}",
+        "data":data
+    }
+
+#Compound query, must also be registered before /movies/{year}
+@router.get("/movies/query", response_model= MovieListResponse, responses={404: {"model": ErrorResponse},400:{"model":ErrorResponse}})
+def query_movies(
+    year: Optional[int] = Query(None, description="Release year"),
+    year_min: Optional[int] = Query(None, description="Released in or after this year"),
+    year_max: Optional[int] = Query(None, description="Released in or before this year"),
+    rating_min: Optional[float] = Query(None, description="Minimum rating"),
+    rating_max: Optional[float] = Query(None, description="Maximum rating"),
+    price_min: Optional[float] = Query(None, description="Minimum price"),
+    price_max: Optional[float] = Query(None, description="Maximum price"),
+    director: Optional[str] = Query(None, description="Director, case insensitive"),
+    genre: Optional[str] = Query(None, description="Genre, case insensitive"),
+    is_watched: Optional[bool] = Query(None, description="Watched status"),
+    params: dict = Depends(page_params),
+):
+    """Endpoint to filter movies on several fields at once
+        Range bounds are inclusive, every given filter must match
+        (e.g. /movies/query?genre=drama&year_min=1990&year_max=1999&rating_min=8)
+    """
+    for low, high, name in ((year_min, year_max, "year"), (rating_min, rating_max, "rating"),
+                            (price_min, price_max, "price")):
+        if low is not None and high is not None and low > high:
+            raise HTTPException(status_code=400, detail=f"{name}_min must not be greater than {name}_max")
+    return list_page(params, lambda total: f"{total} movies found matching the query", "No movies found matching the query",
+                     year=year, year_min=year_min, year_max=year_max, rating_min=rating_min, rating_max=rating_max,
+                     price_min=price_min, price_max=price_max, director=director, genre=genre, is_watched=is_watched)
+
+#Adding endpoint to get list of movies by year with Path Parameter
+@router.get("/movies/{year}", response_model= MovieListResponse)
+def get_movies_by_year(year: int, params: dict = Depends(page_params)):
+    """End point to get movies by release year"""
+    return list_page(params, lambda total: f"{total} movies found for year {year}",
+                     f"No movies found for year {year}", year=year)
 ##Adding endpoint to get the list of movies by director Path  parameter
 @router.get("/movies/director/{director}", response_model= MovieListResponse, responses={404: {"model": ErrorResponse}})
-async def get_movies_by_director(director: str):
+def get_movies_by_director(director: str, params: dict = Depends(page_params)):
     """Get the movies based on director name"""
-    movies_director = db.get_movie_by_director(director)
-    if movies_director is None or len(movies_director) ==0:
-        raise HTTPException(status_code=404, detail=f"No movies found for director {director}")
-    return{
-        "success":True,
-        "message":f"{len(movies_director)}movies matching director {director}",
-        "data": movies_director,
-        "total":len(movies_director)
-    }
+    return list_page(params, lambda total: f"{total}movies matching director {director}",
+                     f"No movies found for director {director}", director=director)
     
 #return movies by Genre path parameter
 @router.get("/movies/genre/{genre}", response_model= MovieListResponse, responses={404: {"model": ErrorResponse}})
-async def get_movies_by_genre(genre: str):
+def get_movies_by_genre(genre: str, params: dict = Depends(page_params)):
     """Get the movies base on genre""" 
-    movies_genre = db.get_movies_by_genre(genre)
-    if movies_genre is None or len(movies_genre) ==0:
-        raise HTTPException(status_code=404, detail=f"No movies found for genre {genre}")
-    return{
-        "success":True,
-        "message":f"{len(movies_genre)} movies matching genre {genre}",
-        "data": movies_genre,
-        "total":len(movies_genre)
-    }
+    return list_page(params, lambda total: f"{total} movies matching genre {genre}",
+                     f"No movies found for genre {genre}", genre=genre)
     
 @router.get("/movies/search/{text_query}", response_model= MovieListResponse, responses={404: {"model": ErrorResponse}})
-async def search_in_movies_title(text_query: str):
-    """Endpoint to search movies by text in title"""
-    search_results = db.search_movies(text_query)
-    if search_results is None or len(search_results) ==0:
-        raise HTTPException(status_code=404, detail=f"No movies found matching search query : {text_query}")
-    return {
-        "success":True,
-        "message":f"{len(search_results)} movies found matching search query : {text_query}",
-        "data":search_results,
-        "total": len(search_results)
-    }
+def search_in_movies_title(text_query: str, params: dict = Depends(page_params),
+                           fuzzy: bool = Query(False, description="Also match misspelled title and director words")):
+    """Endpoint to search movies by text in title
+        All words must match, a trailing * matches as prefix (e.g. inter*)
+        With fuzzy=true words only need to be similar (e.g. interstelar)
+        Results are sorted by relevance unless sort is given
+    """
+    return list_page(params, lambda total: f"{total} movies found matching search query : {text_query}",
+                     f"No movies found matching search query : {text_query}", search=text_query, fuzzy=fuzzy)
     
     
 #Step 47 udpdate Get endpoint to list movies to use MovieListResponse model
 @router.get("/movies",response_model = MovieListResponse)
-def list_movies():
-    """Endpoint to list all movies"""
-    items = db.list_movies()
-    return {
-        "success":True,
-        "message":f"{len(items)} movies found",
-        "data":items,
-        "total": len(items)
-    }
+def list_movies(params: dict = Depends(page_params)):
+    """Endpoint to list all movies, use limit and next_cursor to page"""
+    return list_page(params, lambda total: f"{total} movies found")
 
 
 #Step  33
@@ -111,18 +474,14 @@ def get_movie(movie_id: int):
 # step 35 Put endpoint to update movie details
 #Step 43 Refacto Update to use Pydantic models class
 @router.put("/movies/{movie_id}", response_model= MovieResponse, responses={404: {"model": ErrorResponse},400:{"model":ErrorResponse}})
-def update_movie(movie_id: int, movie_data: MovieUpdate):
+def update_movie(movie_id: int, movie_data: MovieUpdate, durable: bool = DURABLE_QUERY):
     """Endpoint to update existing movie details"""
-    movie = db.get_movie(movie_id)
-    if movie is None:
-        raise HTTPException(status_code=404,detail=f"Movie not found with id : {movie_id}")
-    
     #Update only provided fields
     update_data  = movie_data.model_dump(exclude_unset=True)
     
-    movie.update(update_data)
-    db.movies[movie_id] = movie
-    db.save_data()
+    movie = db.update_movie(movie_id, update_data, durable=durable)
+    if movie is None:
+        raise HTTPException(status_code=404,detail=f"Movie not found with id : {movie_id}")
     
     return {
         "success":True,
@@ -132,16 +491,13 @@ def update_movie(movie_id: int, movie_data: MovieUpdate):
     
 #Step 37 Delete endpoint to remove a movie    
 @router.delete("/movies/{movie_id}", response_model= MovieResponse, responses={404: {"model": ErrorResponse},400:{"model":ErrorResponse}})
-def delete_movie(movie_id:int):
+def delete_movie(movie_id:int, durable: bool = DURABLE_QUERY):
     """Endpoint to delete a movie by its ID"""
-    movie = db.get_movie(movie_id)
+    #Delete the movie
+    movie = db.delete_movie(movie_id, durable=durable)
     if movie is None:
         raise HTTPException(status_code=404, detail=f"Movie not found with id : {movie_id}")
     
-    #Delete the movie
-    del db.movies[movie_id]
-    db.save_data()
-    
     return {
         "success":True,
         "message":f"Movie with id {movie_id} deleted successfully"
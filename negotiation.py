@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import gzip
+import json
+import zlib
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Tuple
+from fastapi.responses import JSONResponse
+from records import dumps_json
+
+try:
+    import brotli
+except ImportError: # optional, br is not offered without it
+    brotli = None
+try:
+    import msgpack
+except ImportError: # optional, MessagePack is not offered without it
+    msgpack = None
+try:
+    import orjson
+except ImportError: # optional, the json module is used without it
+    orjson = None
+
+
+JSON_MEDIA_TYPE = "application/json"
+# MessagePack has no single established media type, the one asked is sent
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+# Streams compressed on the fly, other bodies are compressed whole
+STREAMED_MEDIA_TYPES = ("application/x-ndjson",)
+COMPRESSIBLE_MEDIA_TYPES = (JSON_MEDIA_TYPE, "text/plain") + MSGPACK_MEDIA_TYPES + STREAMED_MEDIA_TYPES
+# Content codings in server preference order, brotli compresses JSON better
+ENCODINGS = ("br", "gzip")
+# Negotiated responses depend on these request headers
+VARY = "Accept, Accept-Encoding"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoding with orjson when installed"""
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+
+class Representation(NamedTuple):
+    """Media type and content coding (None: uncompressed) of a response"""
+    media_type: str
+    encoding: Optional[str]
+
+
+def base_media_type(content_type: Optional[str]) -> str:
+    """Returns the media type of a Content-Type header without parameters"""
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def parse_qualities(header: Optional[str]) -> Dict[str, float]:
+    """Parses an Accept or Accept-Encoding header into value -> quality"""
+    qualities = {}
+    for item in (header or "").split(","):
+        value, *params = [part.strip() for part in item.split(";")]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        qualities[value.lower()] = quality
+    return qualities
+
+
+class ContentNegotiator:
+    """Picks the representation of a response from the Accept and
+        Accept-Encoding request headers and encodes bodies into it
+        JSON bodies are sent as MessagePack to clients preferring it, and
+        bodies of at least min_size bytes are compressed (smaller ones
+        would barely shrink)
+    """
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5,
+                 compression: bool = True, msgpack_enabled: bool = True):
+        self.min_size: int = min_size
+        self.gzip_level: int = gzip_level
+        self.brotli_quality: int = brotli_quality
+        self.encodings: Tuple[str, ...] = tuple(encoding for encoding in ENCODINGS if compression
+                                                and (encoding != "br" or brotli is not None))
+        self.msgpack: bool = msgpack_enabled and msgpack is not None
+
+    def choose(self, accept: Optional[str], accept_encoding: Optional[str]) -> Representation:
+        """Returns the representation the client prefers among the offered
+            ones, JSON and no compression by default
+        """
+        media_type = JSON_MEDIA_TYPE
+        if self.msgpack and accept:
+            qualities = parse_qualities(accept)
+            json_quality = max(qualities.get(JSON_MEDIA_TYPE, 0), qualities.get("application/*", 0), qualities.get("*/*", 0))
+            best = max(MSGPACK_MEDIA_TYPES, key=lambda candidate: qualities.get(candidate, 0))
+            if qualities.get(best, 0) > 0 and qualities[best] >= json_quality:
+                media_type = best
+        encoding = None
+        if self.encodings and accept_encoding:
+            qualities = parse_qualities(accept_encoding)
+            wildcard = qualities.get("*", 0)
+            # ties go to the server preference
+            quality, _, best = max((qualities.get(candidate, wildcard), -rank, candidate)
+                                   for rank, candidate in enumerate(self.encodings))
+            if quality > 0:
+                encoding = best
+        return Representation(media_type, encoding)
+
+    def negotiable(self, content_type: Optional[str]) -> bool:
+        """Checks if a response of this type can be converted or compressed"""
+        return base_media_type(content_type) in COMPRESSIBLE_MEDIA_TYPES
+
+    def streamed(self, content_type: Optional[str]) -> bool:
+        return base_media_type(content_type) in STREAMED_MEDIA_TYPES
+
+    def encode(self, body: bytes, content_type: str, representation: Representation) -> Tuple[bytes, str, Optional[str]]:
+        """Returns a whole body in the representation: the body, its
+            content type and its content coding (None if not compressed)
+        """
+        if representation.media_type != JSON_MEDIA_TYPE and base_media_type(content_type) == JSON_MEDIA_TYPE:
+            body = msgpack.packb(orjson.loads(body) if orjson is not None else json.loads(body))
+            content_type = representation.media_type
+        if representation.encoding is None or len(body) < self.min_size or not self.negotiable(content_type):
+            return body, content_type, None
+        if representation.encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality), content_type, "br"
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0), content_type, "gzip"
+
+    async def encode_stream(self, chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+        """Compresses a streamed body on the fly"""
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, finish = compressor.process, compressor.finish
+        else:
+            # wbits 31 writes the gzip container
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            compress, finish = compressor.compress, compressor.flush
+        async for chunk in chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import json
+import base64
+from typing import List, Optional
+from records import MOVIE_FIELDS
+
+
+# Types of the sort value in a cursor key (see storage.make_sort_key)
+SORT_VALUE_TYPES = {"title": str, "director": str, "genre": str, "synopsis": str, "year": int, "duration": int,
+                    "rating": (int, float), "price": (int, float), "is_watched": bool}
+
+
+def encode_cursor(sort: str, key: tuple) -> str:
+    """Encodes the sort key of the last returned movie as an opaque cursor"""
+    raw = json.dumps({"s": sort, "k": list(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """Decodes a cursor, raises ValueError if invalid or made for another sort"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        key = tuple(data["k"])
+        cursor_sort = data["s"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError(f"Cursor was created for sort={cursor_sort}, not sort={sort}")
+    if not _valid_key(sort.lstrip("-"), key):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def _is(value, types) -> bool:
+    """isinstance where a bool is not an int"""
+    return isinstance(value, types) and (not isinstance(value, bool) or types is bool)
+
+
+def _valid_key(field: str, key: tuple) -> bool:
+    """Checks a cursor key has the shape make_sort_key gives for the field:
+        (id,), (-score, id) or (has value, value, id)
+    """
+    if not key or not _is(key[-1], int):
+        return False
+    if field == "id":
+        return len(key) == 1
+    if field == "relevance":
+        return len(key) == 2 and _is(key[0], (int, float))
+    if len(key) != 3 or not isinstance(key[0], bool):
+        return False
+    if not key[0]:
+        return key[1] == 0 and not isinstance(key[1], bool)
+    return field in SORT_VALUE_TYPES and _is(key[1], SORT_VALUE_TYPES[field])
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parses a comma separated field list, raises ValueError on unknown fields"""
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in MOVIE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in selected:
+        selected.insert(0, "id")
+    return selected
+
+
+def project(movie: dict, fields: Optional[List[str]]) -> dict:
+    """Returns only the selected fields of a movie"""
+    if fields is None:
+        return movie
+    return {field: movie.get(field) for field in fields}
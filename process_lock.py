@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError: # not available on Windows
+    fcntl = None
+
+
+class ProcessLock:
+    """Reentrant lock held by one thread of one process at a time
+        Threads of this process serialize on an RLock, processes on an
+        exclusive flock of the lock file, taken by the outermost acquire
+    """
+    def __init__(self, path: Path):
+        if fcntl is None:
+            raise RuntimeError("Sharing the catalog between processes needs fcntl (POSIX only)")
+        self.path: Path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._depth: int = 0
+        self._fd: int = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self) -> None:
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except OSError:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "ProcessLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
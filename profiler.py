@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# Samples kept while requests run, enough for a request of about a minute
+# at the default interval, older samples are dropped
+MAX_SAMPLES = 6000
+# Collapsed stacks reported per profile, most sampled first
+TOP_STACKS = 25
+# The sampler's own frames are not application code
+PROFILER_FILE = str(Path(__file__).resolve())
+
+
+class SlowRequestProfiler:
+    """Sampling profiler for slow requests
+        While requests are in flight a background thread records the stacks
+        of the threads running application code every interval, when a
+        request ends after more than slow_ms the samples taken during it
+        are aggregated into collapsed stacks ("file:function;..." -> samples,
+        the flame graph input format) and kept in the last profiles
+    """
+    def __init__(self, interval_ms: int = 10, slow_ms: int = 500, keep: int = 20,
+                 root: Optional[Path] = None):
+        self.interval: float = interval_ms / 1000
+        self.slow: float = slow_ms / 1000
+        # only stacks going through files under root are sampled
+        self.root: str = str(root or Path(__file__).resolve().parent)
+        self.profiles: deque = deque(maxlen=keep)
+        self._samples: deque = deque(maxlen=MAX_SAMPLES) # (time, [collapsed stacks])
+        self._active: int = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def begin(self) -> float:
+        """Marks the start of a request, returns its start time"""
+        with self._lock:
+            self._active += 1
+        return time.monotonic()
+
+    def end(self, start: float, method: str, route: str) -> Optional[dict]:
+        """Marks the end of a request, returns its profile if it was slow"""
+        duration = time.monotonic() - start
+        with self._lock:
+            self._active -= 1
+            if duration < self.slow:
+                return None
+            samples = [stacks for sampled_at, stacks in self._samples if sampled_at >= start]
+        counts = Counter(stack for stacks in samples for stack in stacks)
+        profile = {
+            "method": method,
+            "route": route,
+            "duration_ms": round(duration * 1000, 1),
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "samples": len(samples),
+            "stacks": [{"stack": stack, "samples": count} for stack, count in counts.most_common(TOP_STACKS)],
+        }
+        self.profiles.append(profile)
+        print(f"[SlowRequestProfiler.end] {method} {route} took {profile['duration_ms']} ms, {len(samples)} samples")
+        return profile
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join(timeout=1)
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            if not self._active:
+                continue
+            stacks = [stack for thread_id, frame in sys._current_frames().items()
+                      if thread_id != own and (stack := self._collapse(frame))]
+            with self._lock:
+                self._samples.append((time.monotonic(), stacks))
+
+    def _collapse(self, frame) -> Optional[str]:
+        """Returns the collapsed stack of a frame, root first, or None when
+            no frame is application code (idle worker threads, event loop)
+        """
+        names: List[str] = []
+        in_app = False
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(self.root) and "site-packages" not in filename and filename != PROFILER_FILE:
+                in_app = True
+            names.append(f"{Path(filename).name}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names)) if in_app else None
+
+    def summary(self) -> List[Dict]:
+        """Returns the kept profiles, most recent first"""
+        return list(reversed(self.profiles))
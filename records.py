@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import json
+import sys
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+try:
+    import orjson
+except ImportError: # optional, the json module is used without it
+    orjson = None
+
+
+# Fields of a stored movie, in the order of the JSON documents
+MOVIE_FIELDS: Tuple[str, ...] = ("id", "title", "director", "year", "genre", "duration",
+                                 "rating", "synopsis", "price", "is_watched")
+
+# Shared instances of repeated numbers (years, ratings, prices), CPython
+# only caches small ints so every record would box its own copy
+# The pool is bounded, values first seen once it is full are not shared
+VALUE_POOL_SIZE = 4096
+_value_pool: Dict[Any, Any] = {}
+
+
+def dumps_json(content: Any) -> bytes:
+    """Encodes plain data as compact UTF-8 JSON, with orjson when installed
+        (several times faster than the json module, same documents)
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_movie(movie: dict) -> bytes:
+    """Encodes a movie as compact JSON, same bytes as the API's JSON responses"""
+    return dumps_json(movie)
+
+
+def _pooled(value):
+    """Returns the shared instance of a number"""
+    if value is None or isinstance(value, bool):
+        return value
+    key = (type(value), value)
+    shared = _value_pool.get(key)
+    if shared is not None:
+        return shared
+    if len(_value_pool) >= VALUE_POOL_SIZE:
+        return value
+    return _value_pool.setdefault(key, value)
+
+
+def _interned(value: Optional[str]) -> Optional[str]:
+    """Interns repeated text values (director, genre)"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class MovieRecord:
+    """Compact read-only movie stored in memory
+        Uses __slots__ instead of a dict per movie, interns director and
+        genre and shares repeated numbers. Offers the read side of the dict
+        interface (get, [], keys) so indexes can use it directly, dicts are
+        only built at the API boundary with to_dict() or, for the fast
+        response path, encoded once with to_json() and cached
+    """
+    __slots__ = MOVIE_FIELDS + ("_json",)
+
+    def __init__(self, id: int, title: str, director: str, year: int, genre: str,
+                 duration: Optional[int] = None, rating: Optional[float] = None,
+                 synopsis: Optional[str] = None, price: Optional[float] = None,
+                 is_watched: bool = False):
+        set_field = object.__setattr__
+        set_field(self, "id", id)
+        set_field(self, "title", title)
+        set_field(self, "director", _interned(director))
+        set_field(self, "year", _pooled(year))
+        set_field(self, "genre", _interned(genre))
+        set_field(self, "duration", _pooled(duration))
+        set_field(self, "rating", _pooled(rating))
+        set_field(self, "synopsis", _interned(synopsis) if synopsis and len(synopsis) < 32 else synopsis)
+        set_field(self, "price", _pooled(price))
+        set_field(self, "is_watched", is_watched)
+        set_field(self, "_json", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MovieRecord is read-only, use replace()")
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MovieRecord":
+        """Builds a record from a movie dict, unknown keys are ignored"""
+        return cls(**{field: data[field] for field in MOVIE_FIELDS if field in data})
+
+    def to_dict(self) -> dict:
+        """Materializes the record as the dict returned by the API"""
+        return {field: getattr(self, field) for field in MOVIE_FIELDS}
+
+    def to_json(self) -> bytes:
+        """Returns the JSON fragment of the record, encoded on first use
+            Records are immutable so the fragment never goes stale
+        """
+        encoded = self._json
+        if encoded is None:
+            encoded = encode_movie(self.to_dict())
+            object.__setattr__(self, "_json", encoded)
+        return encoded
+
+    def replace(self, **changes) -> "MovieRecord":
+        """Returns a copy with some fields changed"""
+        data = self.to_dict()
+        data.update(changes)
+        return MovieRecord.from_dict(data)
+
+    def get(self, field: str, default=None):
+        return getattr(self, field, default) if field in MOVIE_FIELDS else default
+
+    def __getitem__(self, field: str):
+        if field not in MOVIE_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def keys(self) -> Tuple[str, ...]:
+        return MOVIE_FIELDS
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(MOVIE_FIELDS)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MovieRecord):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"MovieRecord({self.to_dict()!r})"
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import math
+import re
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Tokens are runs of letters/digits, compared case insensitive
+TOKEN_PATTERN = re.compile(r"\w+")
+PREFIX_MARK = "*"
+
+# Weight of a token hit per indexed field, title hits rank first
+FIELD_WEIGHTS: Dict[str, float] = {"title": 3.0, "director": 2.0, "synopsis": 1.0}
+
+
+# Fields of the trigram index behind fuzzy search
+FUZZY_FIELDS: Tuple[str, ...] = ("title", "director")
+# Minimum trigram similarity (Jaccard) of a fuzzy match, as pg_trgm
+DEFAULT_SIMILARITY = 0.3
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Splits a text into normalized tokens"""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(str(text).casefold())
+
+
+def trigrams(token: str) -> frozenset:
+    """Returns the trigrams of a token padded like pg_trgm ("  ab " ...),
+        so short tokens and word starts get trigrams too
+    """
+    padded = f"  {token} "
+    return frozenset(padded[pos:pos + 3] for pos in range(len(padded) - 2))
+
+
+class InvertedIndex:
+    """Inverted index from token to postings (movie id -> score)
+        Maintained incrementally with add/remove, the sorted vocabulary
+        allows prefix queries like "inter*"
+        Writers must be serialized by the caller, searches copy postings
+        before iterating so they can run while the index changes
+    """
+    def __init__(self, fields: Iterable[str] = ("title",)):
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._vocabulary: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._postings
+
+    def clear(self) -> None:
+        """Removes every token from the index"""
+        self._postings = {}
+        self._vocabulary = []
+
+    def _terms(self, movie: dict) -> Dict[str, float]:
+        """Returns the score of each token of a movie"""
+        terms: Dict[str, float] = {}
+        for field in self.fields:
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for token in tokenize(movie.get(field)):
+                terms[token] = terms.get(token, 0.0) + weight
+        return terms
+
+    def add(self, movie: dict) -> None:
+        """Indexes the fields of a movie"""
+        movie_id = movie["id"]
+        for token, score in self._terms(movie).items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            postings[movie_id] = score
+
+    def remove(self, movie: dict) -> None:
+        """Removes a movie from the postings of its tokens"""
+        movie_id = movie["id"]
+        for token in self._terms(movie):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(movie_id, None)
+            if not postings:
+                del self._postings[token]
+                pos = bisect_left(self._vocabulary, token)
+                if pos < len(self._vocabulary) and self._vocabulary[pos] == token:
+                    del self._vocabulary[pos]
+
+    def postings(self, token: str) -> Dict[int, float]:
+        """Returns a copy of the postings of a token"""
+        return dict(self._postings.get(token, {}))
+
+    def _prefix_postings(self, prefix: str) -> Dict[int, float]:
+        """Merges the postings of every token starting with prefix"""
+        merged: Dict[int, float] = {}
+        vocabulary = self._vocabulary
+        pos = bisect_left(vocabulary, prefix)
+        while True:
+            try:
+                token = vocabulary[pos]
+            except IndexError:
+                break
+            pos += 1
+            if not token.startswith(prefix):
+                break
+            for movie_id, score in dict(self._postings.get(token, {})).items():
+                if score > merged.get(movie_id, 0.0):
+                    merged[movie_id] = score
+        return merged
+
+    def search(self, query: str) -> List[Tuple[int, float]]:
+        """Returns (movie id, score) pairs matching every term of the query
+            Terms ending with * match as prefix, results are ranked by score
+        """
+        term_postings: List[Dict[int, float]] = []
+        for raw in query.split():
+            is_prefix = raw.endswith(PREFIX_MARK)
+            tokens = tokenize(raw)
+            if not tokens:
+                continue
+            for pos, token in enumerate(tokens):
+                if is_prefix and pos == len(tokens) - 1:
+                    postings = self._prefix_postings(token)
+                else:
+                    postings = dict(self._postings.get(token, {}))
+                if not postings:
+                    return []
+                term_postings.append(postings)
+        if not term_postings:
+            return []
+
+        # intersect starting with the smallest posting list
+        term_postings.sort(key=len)
+        scores = dict(term_postings[0])
+        for postings in term_postings[1:]:
+            scores = {movie_id: score + postings[movie_id]
+                      for movie_id, score in scores.items() if movie_id in postings}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class TrigramIndex:
+    """Typo tolerant index: the words of the fuzzy fields and, for every
+        trigram, the words containing it
+        A query word is matched to the indexed words with a trigram
+        similarity above a threshold, candidates only come from the
+        postings of its rarest trigrams (a match must share at least
+        ceil(threshold * trigrams) of them), so the cost depends on the
+        vocabulary, not on the number of movies
+        Writers must be serialized by the caller
+    """
+    def __init__(self, fields: Iterable[str] = FUZZY_FIELDS):
+        self.words = InvertedIndex(fields)
+        self._trigrams: Dict[str, set] = {}
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return self.words.fields
+
+    def add(self, movie: dict) -> None:
+        """Indexes the fields of a movie and the trigrams of new words"""
+        new_words = [token for token in self.words._terms(movie) if token not in self.words]
+        self.words.add(movie)
+        for word in new_words:
+            for gram in trigrams(word):
+                self._trigrams.setdefault(gram, set()).add(word)
+
+    def remove(self, movie: dict) -> None:
+        """Removes a movie, and the trigrams of the words it was the last to use"""
+        tokens = list(self.words._terms(movie))
+        self.words.remove(movie)
+        for word in tokens:
+            if word in self.words:
+                continue
+            for gram in trigrams(word):
+                words = self._trigrams.get(gram)
+                if words is None:
+                    continue
+                words.discard(word)
+                if not words:
+                    del self._trigrams[gram]
+
+    def similar(self, token: str, threshold: float = DEFAULT_SIMILARITY) -> List[Tuple[str, float]]:
+        """Returns the indexed words whose similarity with token (shared
+            trigrams / union of trigrams) is at least threshold
+        """
+        grams = trigrams(token)
+        needed = max(1, math.ceil(threshold * len(grams)))
+        # a word sharing needed grams has one among the len - needed + 1 rarest
+        ordered = sorted(grams, key=lambda gram: len(self._trigrams.get(gram, ())))
+        candidates = set()
+        for gram in ordered[:len(grams) - needed + 1]:
+            candidates.update(self._trigrams.get(gram, ()))
+        matches = []
+        for word in candidates:
+            word_grams = trigrams(word)
+            shared = len(grams & word_grams)
+            similarity = shared / (len(grams) + len(word_grams) - shared)
+            if similarity >= threshold:
+                matches.append((word, similarity))
+        return matches
+
+    def search(self, query: str, threshold: float = DEFAULT_SIMILARITY) -> List[Tuple[int, float]]:
+        """Returns (movie id, score) pairs where every query word matches a
+            similar word, scores are weighted by similarity (exact words
+            rank first), results are ranked by score
+        """
+        term_postings: List[Dict[int, float]] = []
+        for token in tokenize(query):
+            merged: Dict[int, float] = {}
+            for word, similarity in self.similar(token, threshold):
+                for movie_id, score in self.words.postings(word).items():
+                    if score * similarity > merged.get(movie_id, 0.0):
+                        merged[movie_id] = score * similarity
+            if not merged:
+                return []
+            term_postings.append(merged)
+        if not term_postings:
+            return []
+
+        term_postings.sort(key=len)
+        scores = dict(term_postings[0])
+        for postings in term_postings[1:]:
+            scores = {movie_id: score + postings[movie_id]
+                      for movie_id, score in scores.items() if movie_id in postings}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
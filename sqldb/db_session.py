@@ -1,11 +1,48 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
-from mongodb_models import Base
+from sqldb.mongodb_models import Base
+from config import settings
+from indexes import normalize_key
 
 #Define session databases
 
-engine = create_engine("sqlite:///./movies.db", echo=True, future=True)
-Base.metadata.create_all(bind=engine)
+def register_text_functions(dbapi_connection) -> None:
+    """Registers the text folding of the JSON backend, SQLite lower() only
+        folds ASCII letters: normalize_key() for the director and genre
+        filters and their indexes, casefold() for sorting
+    """
+    dbapi_connection.create_function("normalize_key", 1, lambda value: None if value is None else normalize_key(value),
+                                     deterministic=True)
+    dbapi_connection.create_function("casefold", 1, lambda value: value.casefold() if isinstance(value, str) else value,
+                                     deterministic=True)
+
+def create_sqlite_engine(url: str, echo: bool = False, pool_size: int = 5) -> Engine:
+    """Creates a pooled SQLite engine in WAL mode and the tables, every
+        connection gets the text functions the indexes and queries use
+    """
+    engine = create_engine(
+        url,
+        echo=echo,
+        future=True,
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets readers run concurrently with the writer"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+        register_text_functions(dbapi_connection)
+
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+engine = create_sqlite_engine(settings.sqlite_url, echo=settings.sql_echo, pool_size=settings.sqlite_pool_size)
 async_session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -15,4 +52,4 @@ def get_db():
         yield db
     finally:
         db.close()
-        
\ No newline at end of file
+        
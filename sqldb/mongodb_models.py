@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from sqlalchemy import Index, func
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -13,13 +14,22 @@ class Movie(Base):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     title: Mapped[str]
     director: Mapped[str]
-    year: Mapped[int]
+    year: Mapped[int] = mapped_column(index=True)
     genre: Mapped[str]
     duration: Mapped[int | None]
-    rating: Mapped[float | None]
+    rating: Mapped[float | None] = mapped_column(index=True)
     synopsis: Mapped[str | None]
-    price: Mapped[float | None]
+    price: Mapped[float | None] = mapped_column(index=True)
     is_watched: Mapped[bool] = mapped_column(default=False)
 
+    def to_dict(self) -> dict:
+        """Returns the movie as the dict used by the API"""
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns}
+
+# director and genre lookups are case insensitive, normalize_key is the
+# Python function registered on each connection by create_sqlite_engine
+Index("ix_movies_director_key", func.normalize_key(Movie.director))
+Index("ix_movies_genre_key", func.normalize_key(Movie.genre))
+
 
 
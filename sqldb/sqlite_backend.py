@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.orm import Session, sessionmaker
+from sqldb.mongodb_models import Movie
+from indexes import normalize_key
+from search_index import PREFIX_MARK, tokenize
+from records import encode_movie
+from storage import (FILTER_FIELDS, RANGE_FILTERS, IdempotencyKeys, MovieStorage, batch_fingerprint, make_sort_key,
+                     parse_sort, select_page)
+
+
+# Columns of the full text table and their bm25 weights (title hits rank first)
+FTS_COLUMNS = ("title", "director", "synopsis")
+FTS_WEIGHTS = (3.0, 2.0, 1.0)
+# Text columns are sorted and filtered case insensitive
+TEXT_FIELDS = ("title", "director", "genre")
+# Indexes on lower(), which only folds ASCII letters, replaced by normalize_key()
+OLD_INDEXES = ("ix_movies_director_lower", "ix_movies_genre_lower")
+
+
+class SqliteMovieStorage(MovieStorage):
+    """Movie storage backed by SQLite through the SQLAlchemy Movie model
+        Filters and sorts run as indexed SQL queries, text search uses an
+        FTS5 table kept in sync in the same transaction as each write
+    """
+    def __init__(self, engine: Optional[Engine] = None, search_fields: Sequence[str] = ("title",)):
+        if engine is None:
+            from sqldb.db_session import engine
+        self.engine: Engine = engine
+        self.session_factory = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        self.search_fields: Tuple[str, ...] = tuple(field for field in search_fields if field in FTS_COLUMNS)
+        # idempotency keys of the batch operations, per process
+        self._batch_keys = IdempotencyKeys()
+        self._batch_lock = threading.Lock()
+        self._create_fts()
+
+    @property
+    def version(self) -> int:
+        """Number of writes committed by every process, read from the
+            database so the response cache of each worker sees the writes
+            of the others
+        """
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT version FROM catalog_version")).scalar_one()
+
+    def _bump_version(self, session: Session) -> None:
+        """Marks the catalog as changed, in the transaction of the write"""
+        session.execute(text("UPDATE catalog_version SET version = version + 1"))
+
+    def _create_fts(self) -> None:
+        """Creates the FTS5 and version tables, rebuilds the FTS5 table
+            if it is out of sync, replaces the indexes of older versions
+        """
+        with self.engine.begin() as conn:
+            for name in OLD_INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            for index in Movie.__table__.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+            conn.execute(text("CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                              "version INTEGER NOT NULL)"))
+            conn.execute(text("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)"))
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5({', '.join(FTS_COLUMNS)})"))
+            indexed = conn.execute(text("SELECT count(*) FROM movies_fts")).scalar_one()
+            stored = conn.execute(select(func.count()).select_from(Movie)).scalar_one()
+            if indexed != stored:
+                conn.execute(text("DELETE FROM movies_fts"))
+                conn.execute(text(f"INSERT INTO movies_fts(rowid, {', '.join(FTS_COLUMNS)}) "
+                                  f"SELECT id, {', '.join(FTS_COLUMNS)} FROM movies"))
+
+    def _fts_put(self, session: Session, movie: Movie) -> None:
+        """Indexes the text of a movie, replacing the previous version"""
+        session.execute(text("DELETE FROM movies_fts WHERE rowid = :id"), {"id": movie.id})
+        session.execute(text(f"INSERT INTO movies_fts(rowid, {', '.join(FTS_COLUMNS)}) "
+                             f"VALUES (:id, {', '.join(':' + column for column in FTS_COLUMNS)})"),
+                        {"id": movie.id, **{column: getattr(movie, column) for column in FTS_COLUMNS}})
+
+    #Write operations, every write is its own committed transaction
+    def add_movie(self, movie_data: dict, durable: bool = False) -> dict:
+        """Adds a movie, returns it with its id"""
+        return self.add_movies([movie_data])[0]
+
+    def add_movies(self, movies_data: List[dict], durable: bool = False) -> List[dict]:
+        """Adds several movies in a single transaction"""
+        if not movies_data:
+            return []
+        with self.session_factory.begin() as session:
+            movies = [Movie(**movie_data) for movie_data in movies_data]
+            session.add_all(movies)
+            session.flush()
+            for movie in movies:
+                self._fts_put(session, movie)
+            self._bump_version(session)
+        return [movie.to_dict() for movie in movies]
+
+    def update_movie(self, movie_id: int, changes: dict, durable: bool = False) -> Optional[dict]:
+        """Applies a partial update, returns None if not found"""
+        with self.session_factory.begin() as session:
+            movie = session.get(Movie, movie_id)
+            if movie is None:
+                return None
+            for field, value in changes.items():
+                if field != "id":
+                    setattr(movie, field, value)
+            session.flush()
+            self._fts_put(session, movie)
+            self._bump_version(session)
+        return movie.to_dict()
+
+    def delete_movie(self, movie_id: int, durable: bool = False) -> Optional[dict]:
+        """Deletes a movie, returns None if not found"""
+        with self.session_factory.begin() as session:
+            movie = session.get(Movie, movie_id)
+            if movie is None:
+                return None
+            deleted = movie.to_dict()
+            session.delete(movie)
+            session.execute(text("DELETE FROM movies_fts WHERE rowid = :id"), {"id": movie_id})
+            self._bump_version(session)
+        return deleted
+
+    def _apply_batch(self, op: str, changes: Optional[dict], ids: Optional[Iterable[int]], key: Optional[str],
+                     filters: dict) -> dict:
+        """Runs a batch update ("put") or delete ("del") in one transaction"""
+        ids = list(dict.fromkeys(ids)) if ids is not None else None
+        conditions = self._where(filters)
+        if ids is None and not conditions:
+            raise ValueError("A batch operation needs ids or at least one filter")
+        fingerprint = batch_fingerprint(op, changes, ids, filters) if key is not None else None
+        # the lock keeps two retries of a key from both running
+        with self._batch_lock:
+            if key is not None:
+                result = self._batch_keys.get(key, fingerprint)
+                if result is not None:
+                    return result
+            if ids is not None:
+                conditions.append(Movie.id.in_(ids))
+            with self.session_factory.begin() as session:
+                movies = list(session.execute(select(Movie).where(*conditions).order_by(Movie.id)).scalars())
+                if op == "put":
+                    for movie in movies:
+                        for field, value in changes.items():
+                            if field != "id":
+                                setattr(movie, field, value)
+                    session.flush()
+                    for movie in movies:
+                        self._fts_put(session, movie)
+                else:
+                    for movie in movies:
+                        session.delete(movie)
+                        session.execute(text("DELETE FROM movies_fts WHERE rowid = :id"), {"id": movie.id})
+                if movies:
+                    self._bump_version(session)
+            changed = [movie.id for movie in movies]
+            found = set(changed)
+            result = {"ids": changed, "missing": [movie_id for movie_id in ids or () if movie_id not in found],
+                      "replayed": False}
+            if key is not None:
+                self._batch_keys.put(key, fingerprint, result)
+            return result
+
+    def update_movies(self, changes: dict, ids: Optional[Iterable[int]] = None, key: Optional[str] = None,
+                      durable: bool = False, **filters) -> dict:
+        """Applies the same partial update to every selected movie"""
+        return self._apply_batch("put", changes, ids, key, filters)
+
+    def delete_movies(self, ids: Optional[Iterable[int]] = None, key: Optional[str] = None,
+                      durable: bool = False, **filters) -> dict:
+        """Deletes every selected movie"""
+        return self._apply_batch("del", None, ids, key, filters)
+
+    #Read operations
+    def get_movie(self, movie_id: int) -> Optional[dict]:
+        """Returns a movie by id if found else None"""
+        with self.session_factory() as session:
+            movie = session.get(Movie, movie_id)
+            return movie.to_dict() if movie is not None else None
+
+    def _where(self, filters: dict) -> list:
+        """Translates the filters into indexed SQL conditions"""
+        conditions = []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if field == "year":
+                conditions.append(Movie.year == value)
+            elif field in ("director", "genre"):
+                conditions.append(func.normalize_key(getattr(Movie, field)) == normalize_key(value))
+            elif field == "is_watched":
+                conditions.append(Movie.is_watched == bool(value))
+            elif field in RANGE_FILTERS:
+                column, bound = RANGE_FILTERS[field]
+                column = getattr(Movie, column)
+                conditions.append(column >= value if bound == "min" else column <= value)
+            else:
+                raise ValueError(f"Cannot filter by {field}, valid filters: {', '.join(FILTER_FIELDS)}")
+        return conditions
+
+    def count_movies(self, **filters) -> int:
+        """Returns the number of movies matching the filters"""
+        with self.session_factory() as session:
+            return session.execute(select(func.count()).select_from(Movie).where(*self._where(filters))).scalar_one()
+
+    def find_movies(self, sort: str = "id", limit: Optional[int] = None, after: Optional[tuple] = None,
+                    **filters) -> Tuple[List[dict], Optional[tuple]]:
+        """Returns one page of the movies matching the filters
+            Keyset pagination runs in SQL: ORDER BY the sort column and id
+        """
+        field, descending = parse_sort(sort)
+        conditions = self._where(filters)
+        if field in ("id", "relevance"):
+            order = [Movie.id.desc() if descending else Movie.id.asc()]
+            if after is not None:
+                conditions.append(Movie.id < after[-1] if descending else Movie.id > after[-1])
+        else:
+            column = getattr(Movie, field)
+            if field in TEXT_FIELDS:
+                column = func.casefold(column)
+            # SQLite sorts NULL first ascending and last descending,
+            # the same order as make_sort_key
+            order = [column.desc(), Movie.id.desc()] if descending else [column.asc(), Movie.id.asc()]
+            if after is not None:
+                present, value, last_id = after
+                if descending:
+                    condition = (and_(column.is_(None), Movie.id < last_id) if not present else
+                                 or_(column.is_(None), column < value, and_(column == value, Movie.id < last_id)))
+                else:
+                    condition = (or_(column.is_not(None), Movie.id > last_id) if not present else
+                                 and_(column.is_not(None), or_(column > value, and_(column == value, Movie.id > last_id))))
+                conditions.append(condition)
+
+        query = select(Movie).where(*conditions).order_by(*order)
+        if limit is not None:
+            query = query.limit(limit + 1)
+        with self.session_factory() as session:
+            movies = [movie.to_dict() for movie in session.execute(query).scalars()]
+        if limit is None or len(movies) <= limit:
+            return movies, None
+        page = movies[:limit]
+        return page, make_sort_key(field)(page[-1])
+
+    def _match_expression(self, query: str) -> Optional[str]:
+        """Builds the FTS5 MATCH expression, every term must match"""
+        terms = []
+        for raw in query.split():
+            tokens = tokenize(raw)
+            for pos, token in enumerate(tokens):
+                prefix = PREFIX_MARK if raw.endswith(PREFIX_MARK) and pos == len(tokens) - 1 else ""
+                terms.append(f'"{token}"{prefix}')
+        if not terms or not self.search_fields:
+            return None
+        return f"{{{' '.join(self.search_fields)}}} : ({' AND '.join(terms)})"
+
+    def search_ranked(self, query: str, fuzzy: bool = False) -> List[Tuple[int, float]]:
+        """Returns the (movie id, bm25 score) pairs matching a text query,
+            best first
+        """
+        if fuzzy:
+            raise ValueError("Fuzzy search is not supported by the sqlite backend")
+        expression = self._match_expression(query)
+        if expression is None:
+            return []
+        weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT rowid, -bm25(movies_fts, {weights}) AS score FROM movies_fts "
+                                     f"WHERE movies_fts MATCH :expression ORDER BY score DESC, rowid"),
+                                {"expression": expression})
+            return [(row[0], row[1]) for row in rows]
+
+    def search_page(self, query: str, sort: str = "relevance", limit: Optional[int] = None,
+                    after: Optional[tuple] = None, encoded: bool = False,
+                    fuzzy: bool = False) -> Tuple[List[Union[dict, bytes]], Optional[tuple], int]:
+        """Returns one page of the movies matching a text query"""
+        field, descending = parse_sort(sort)
+        scores = dict(self.search_ranked(query, fuzzy))
+        if not scores:
+            return [], None, 0
+        with self.session_factory() as session:
+            movies = [movie.to_dict() for movie in
+                      session.execute(select(Movie).where(Movie.id.in_(list(scores)))).scalars()]
+        page, last_key = select_page(movies, make_sort_key(field, scores), descending, limit, after)
+        return [encode_movie(movie) for movie in page] if encoded else page, last_key, len(scores)
+
+    def iter_movies(self, batch_size: int = 500) -> Iterator[dict]:
+        """Yields every movie ordered by id, one batch query at a time"""
+        last_id = 0
+        while True:
+            with self.session_factory() as session:
+                batch = [movie.to_dict() for movie in session.execute(
+                    select(Movie).where(Movie.id > last_id).order_by(Movie.id).limit(batch_size)).scalars()]
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1]["id"]
+
+    def close(self) -> None:
+        """Closes the pooled connections"""
+        self.engine.dispose()
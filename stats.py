@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+
+# Fields the catalog stats can be grouped by
+GROUP_FIELDS: Tuple[str, ...] = ("genre", "year", "director")
+# Numeric fields summarized in every aggregate
+SUMMARY_FIELDS: Tuple[str, ...] = ("rating", "price", "duration")
+
+
+def group_key(value) -> Hashable:
+    """Returns the bucket of a value, text groups are case insensitive"""
+    return value.strip().casefold() if isinstance(value, str) else value
+
+
+class Summary:
+    """Running count, sum, min and max of a numeric field
+        Values are counted by multiplicity so min/max survive removals,
+        they are only recomputed when the last copy of the min/max leaves
+    """
+    __slots__ = ("count", "total", "min", "max", "_values")
+
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0
+        self.min = None
+        self.max = None
+        self._values: Dict[float, int] = {}
+
+    def add(self, value) -> None:
+        if value is None:
+            return
+        self.count += 1
+        self.total += value
+        self._values[value] = self._values.get(value, 0) + 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def remove(self, value) -> None:
+        if value is None or value not in self._values:
+            return
+        self.count -= 1
+        self.total -= value
+        remaining = self._values[value] - 1
+        if remaining:
+            self._values[value] = remaining
+            return
+        del self._values[value]
+        if not self._values:
+            self.total, self.min, self.max = 0, None, None
+        elif value == self.min:
+            self.min = min(self._values)
+        elif value == self.max:
+            self.max = max(self._values)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": round(self.total, 2),
+            "average": round(self.total / self.count, 4) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+class Aggregate:
+    """Counts and numeric summaries of a set of movies"""
+    __slots__ = ("label", "count", "watched", "summaries")
+
+    def __init__(self, label=None):
+        self.label = label # value shown for the group (first one seen)
+        self.count: int = 0
+        self.watched: int = 0
+        self.summaries: Dict[str, Summary] = {field: Summary() for field in SUMMARY_FIELDS}
+
+    def add(self, movie) -> None:
+        self.count += 1
+        self.watched += bool(movie.get("is_watched"))
+        for field, summary in self.summaries.items():
+            summary.add(movie.get(field))
+
+    def remove(self, movie) -> None:
+        self.count -= 1
+        self.watched -= bool(movie.get("is_watched"))
+        for field, summary in self.summaries.items():
+            summary.remove(movie.get(field))
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "watched": self.watched,
+            "unwatched": self.count - self.watched,
+            "watched_ratio": round(self.watched / self.count, 4) if self.count else None,
+            **{field: summary.to_dict() for field, summary in self.summaries.items()},
+        }
+
+
+class CatalogStats:
+    """Aggregates of the whole catalog and of each group, maintained
+        incrementally with add/remove so reading them is O(groups)
+        Writers must be serialized by the caller
+    """
+    def __init__(self, movies: Iterable = ()):
+        self.clear()
+        for movie in movies:
+            self.add(movie)
+
+    def clear(self) -> None:
+        """Resets every aggregate"""
+        self.overall = Aggregate()
+        self.groups: Dict[str, Dict[Hashable, Aggregate]] = {field: {} for field in GROUP_FIELDS}
+
+    def add(self, movie) -> None:
+        """Counts a movie in the overall and group aggregates"""
+        self.overall.add(movie)
+        for field, groups in self.groups.items():
+            value = movie.get(field)
+            key = group_key(value)
+            aggregate = groups.get(key)
+            if aggregate is None:
+                aggregate = groups[key] = Aggregate(value)
+            aggregate.add(movie)
+
+    def remove(self, movie) -> None:
+        """Removes a movie counted before, dropping empty groups"""
+        self.overall.remove(movie)
+        for field, groups in self.groups.items():
+            key = group_key(movie.get(field))
+            aggregate = groups.get(key)
+            if aggregate is None:
+                continue
+            aggregate.remove(movie)
+            if aggregate.count <= 0:
+                del groups[key]
+
+    def summary(self, group_by: Optional[str] = None) -> dict:
+        """Returns the overall aggregate and, with group_by, one per group"""
+        data = {"group_by": group_by, "overall": self.overall.to_dict()}
+        if group_by is not None:
+            if group_by not in self.groups:
+                raise ValueError(f"Cannot group by {group_by}, valid fields: {', '.join(GROUP_FIELDS)}")
+            groups = sorted(self.groups[group_by].values(), key=lambda aggregate: str(group_key(aggregate.label)))
+            data["groups"] = [{"key": aggregate.label, **aggregate.to_dict()} for aggregate in groups]
+        return data
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+import hashlib
+import heapq
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from records import encode_movie
+from stats import CatalogStats
+
+
+# Range filters, name -> (field, bound), bounds are inclusive
+RANGE_FILTERS = {
+    "year_min": ("year", "min"), "year_max": ("year", "max"),
+    "rating_min": ("rating", "min"), "rating_max": ("rating", "max"),
+    "price_min": ("price", "min"), "price_max": ("price", "max"),
+}
+# Filters accepted by count_movies, find_movies and query_movies
+FILTER_FIELDS = ("year", "director", "genre", "is_watched") + tuple(RANGE_FILTERS)
+# Fields a movie list can be sorted by, "relevance" only applies to search
+SORT_FIELDS = ("id", "title", "director", "year", "genre", "duration", "rating", "price", "relevance")
+
+
+def parse_sort(sort: str) -> Tuple[str, bool]:
+    """Parses "field" or "-field" into (field, descending)"""
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort by {field}, valid fields: {', '.join(SORT_FIELDS)}")
+    return field, descending
+
+
+def make_sort_key(field: str, scores: Optional[Dict[int, float]] = None) -> Callable[[dict], tuple]:
+    """Returns a total order key (ties broken by id) for a sort field
+        Missing values sort first, text compares case insensitive
+    """
+    if field == "id":
+        return lambda movie: (movie["id"],)
+    if field == "relevance":
+        scores = scores or {}
+        return lambda movie: (-scores.get(movie["id"], 0.0), movie["id"])
+    def key(movie: dict) -> tuple:
+        value = movie.get(field)
+        if value is None:
+            return (False, 0, movie["id"])
+        if isinstance(value, str):
+            value = value.casefold()
+        return (True, value, movie["id"])
+    return key
+
+
+def select_page(candidates: Iterable[dict], key: Callable[[dict], tuple], descending: bool,
+                limit: Optional[int], after: Optional[tuple]) -> Tuple[List[dict], Optional[tuple]]:
+    """Cuts one keyset page out of unordered candidates with a bounded heap
+        Returns the page and the key of its last movie if more follow
+    """
+    if after is not None:
+        if descending:
+            candidates = (movie for movie in candidates if key(movie) < after)
+        else:
+            candidates = (movie for movie in candidates if key(movie) > after)
+    if limit is None:
+        return sorted(candidates, key=key, reverse=descending), None
+    if descending:
+        page = heapq.nlargest(limit + 1, candidates, key=key)
+    else:
+        page = heapq.nsmallest(limit + 1, candidates, key=key)
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, key(page[-1])
+
+
+# Results of the last batch operations remembered by idempotency key
+IDEMPOTENCY_KEYS_KEPT = 10000
+
+
+class IdempotencyConflict(ValueError):
+    """An idempotency key was reused for a different batch"""
+
+
+class NotDurable(RuntimeError):
+    """A durable write was applied in memory but its flush failed or did
+        not finish in time
+    """
+
+
+def batch_fingerprint(op: str, changes: Optional[dict], ids: Optional[Iterable[int]], filters: dict) -> str:
+    """Identifies the request of a batch operation, a retry has the same"""
+    request = [op, changes, list(ids) if ids is not None else None,
+               {name: value for name, value in filters.items() if value is not None}]
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class IdempotencyKeys:
+    """Bounded map of idempotency key -> (request fingerprint, result) of
+        the last batch operations, the oldest keys are forgotten first
+    """
+    def __init__(self, size: int = IDEMPOTENCY_KEYS_KEPT):
+        self.size = size
+        self._results: "OrderedDict[str, Tuple[Optional[str], dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, fingerprint: Optional[str]) -> Optional[dict]:
+        """Returns the result of the batch applied with key, marked as
+            replayed, or None if the key is unknown
+            Raises IdempotencyConflict if it was used for another request
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            self._results.move_to_end(key)
+        if fingerprint is not None and entry[0] is not None and entry[0] != fingerprint:
+            raise IdempotencyConflict(f"Idempotency key {key} was already used for a different batch")
+        return {**entry[1], "replayed": True}
+
+    def put(self, key: str, fingerprint: Optional[str], result: dict) -> None:
+        with self._lock:
+            self._results[key] = (fingerprint, {**result, "replayed": False})
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+
+class MovieStorage(ABC):
+    """Interface of a movie catalog storage backend
+        Movies are plain dicts with an "id" key, text filters (director,
+        genre) are case insensitive and pages use keyset pagination: after
+        is the sort key of the last movie of the previous page
+    """
+    # incremented on every mutation, lets callers invalidate derived data
+    version: int = 0
+
+    #Write operations, durable waits until the change is on disk
+    @abstractmethod
+    def add_movie(self, movie_data: dict, durable: bool = False) -> dict:
+        """Adds a movie, returns it with its id"""
+
+    @abstractmethod
+    def add_movies(self, movies_data: List[dict], durable: bool = False) -> List[dict]:
+        """Adds several movies at once, returns them with their ids"""
+
+    @abstractmethod
+    def update_movie(self, movie_id: int, changes: dict, durable: bool = False) -> Optional[dict]:
+        """Applies a partial update, returns None if not found"""
+
+    @abstractmethod
+    def delete_movie(self, movie_id: int, durable: bool = False) -> Optional[dict]:
+        """Deletes a movie, returns None if not found"""
+
+    #Batch operations select movies by ids, filters or both (ids matching
+    #the filters), apply to all of them atomically and persist once
+    #They return {"ids": changed ids, "missing": requested ids not found
+    #or not matching, "replayed": True when key was already applied}
+    @abstractmethod
+    def update_movies(self, changes: dict, ids: Optional[Iterable[int]] = None, key: Optional[str] = None,
+                      durable: bool = False, **filters) -> dict:
+        """Applies the same partial update to every selected movie"""
+
+    @abstractmethod
+    def delete_movies(self, ids: Optional[Iterable[int]] = None, key: Optional[str] = None,
+                      durable: bool = False, **filters) -> dict:
+        """Deletes every selected movie"""
+
+    #Read operations
+    @abstractmethod
+    def get_movie(self, movie_id: int) -> Optional[dict]:
+        """Returns a movie by id if found else None"""
+
+    @abstractmethod
+    def count_movies(self, **filters) -> int:
+        """Returns the number of movies matching the filters"""
+
+    @abstractmethod
+    def find_movies(self, sort: str = "id", limit: Optional[int] = None, after: Optional[tuple] = None,
+                    **filters) -> Tuple[List[dict], Optional[tuple]]:
+        """Returns one page of the movies matching the filters and the
+            sort key to continue after (None on the last page)
+        """
+
+    def query_movies(self, sort: str = "id", limit: Optional[int] = None, after: Optional[tuple] = None,
+                     encoded: bool = False, **filters) -> Tuple[List[Union[dict, bytes]], Optional[tuple], int]:
+        """Returns one page of the movies matching the filters, the sort key
+            to continue after and the total number of matches
+            encoded returns each movie as its JSON bytes instead of a dict
+        """
+        total = self.count_movies(**filters)
+        if total == 0:
+            return [], None, 0
+        page, last_key = self.find_movies(sort=sort, limit=limit, after=after, **filters)
+        return [encode_movie(movie) for movie in page] if encoded else page, last_key, total
+
+    @abstractmethod
+    def search_ranked(self, query: str, fuzzy: bool = False) -> List[Tuple[int, float]]:
+        """Returns the (movie id, score) pairs matching a text query, best
+            first, fuzzy tolerates misspelled words, ValueError if not
+            supported
+        """
+
+    @abstractmethod
+    def search_page(self, query: str, sort: str = "relevance", limit: Optional[int] = None,
+                    after: Optional[tuple] = None, encoded: bool = False,
+                    fuzzy: bool = False) -> Tuple[List[Union[dict, bytes]], Optional[tuple], int]:
+        """Returns one page of the movies matching a text query, the sort
+            key to continue after and the total number of matches
+            encoded returns each movie as its JSON bytes instead of a dict
+            fuzzy tolerates misspelled words, ValueError if not supported
+        """
+
+    def catalog_stats(self, group_by: Optional[str] = None) -> dict:
+        """Returns counts, watched ratio and rating/price/duration summaries
+            of the catalog, and of each group with group_by
+            Backends without running aggregates compute them in one scan
+        """
+        return CatalogStats(self.iter_movies()).summary(group_by)
+
+    @abstractmethod
+    def iter_movies(self, batch_size: int = 500) -> Iterator[dict]:
+        """Yields every movie ordered by id"""
+
+    #Change feed of the mutations, backends without one raise ValueError
+    #change_seq is the sequence of the last change (None without a feed)
+    change_seq: Optional[int] = None
+
+    def changes_since(self, since: int, limit: Optional[int] = None) -> Tuple[List[dict], int, bool]:
+        """Returns the changes after the sequence since, the sequence to
+            resume from and whether more changes follow
+        """
+        raise ValueError("This storage backend has no change feed")
+
+    def close(self) -> None:
+        """Releases the resources of the backend"""
+
+    def refresh(self) -> bool:
+        """Picks up changes made by other processes, returns True if the
+            catalog changed (backends without a local copy do nothing)
+        """
+        return False
+
+    #Convenience helpers built on the operations above
+    def list_movies(self) -> List[dict]:
+        """Returns all movies"""
+        return list(self.iter_movies())
+
+    def search_movies(self, query: str, fuzzy: bool = False) -> List[dict]:
+        """Returns every movie matching a text query ranked by relevance"""
+        return self.search_page(query, fuzzy=fuzzy)[0]
+
+    def get_movie_by_year(self, year: int) -> List[dict]:
+        """Returns a list of movies released in a given year"""
+        return self.find_movies(year=year)[0]
+
+    def get_movie_by_director(self, director: str) -> List[dict]:
+        """Returns a list of movies by a given director"""
+        return self.find_movies(director=director)[0]
+
+    def get_movies_by_genre(self, genre: str) -> List[dict]:
+        """Returns a list of movies by a given genre"""
+        return self.find_movies(genre=genre)[0]
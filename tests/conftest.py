@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import sys
+from pathlib import Path
+import pytest
+
+# the modules live at the repository root, importable from any working directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from indexes import CatalogIndexes
+
+
+def flatten(value, path: str = "") -> dict:
+    """Flattens nested data into path -> value, for pytest.approx"""
+    if isinstance(value, dict):
+        return {key: item for name, child in value.items() for key, item in flatten(child, f"{path}/{name}").items()}
+    if isinstance(value, (list, tuple)):
+        return {key: item for pos, child in enumerate(value) for key, item in flatten(child, f"{path}[{pos}]").items()}
+    return {path: value}
+
+
+def index_state(indexes: CatalogIndexes) -> dict:
+    """Comparable content of every index"""
+    return {
+        "by_year": indexes.by_year, "by_director": indexes.by_director, "by_genre": indexes.by_genre,
+        "by_watched": indexes.by_watched, "sorted": indexes.sorted, "ids": indexes.ids,
+        "search": indexes.search._postings, "vocabulary": indexes.search._vocabulary,
+        "fuzzy": indexes.fuzzy.words._postings, "trigrams": indexes.fuzzy._trigrams,
+    }
+
+
+def stats_state(indexes: CatalogIndexes) -> dict:
+    return flatten({group_by: indexes.stats.summary(group_by) for group_by in (None, "genre", "year", "director")})
+
+
+def indexes_match(db) -> bool:
+    """Checks the live indexes of db against indexes built from its movies"""
+    built = CatalogIndexes.build(db.movies.values(), db.indexes.search.fields)
+    # running totals drift with the order of additions and removals
+    return (index_state(db.indexes) == index_state(built)
+            and stats_state(db.indexes) == pytest.approx(stats_state(built), abs=1e-3))
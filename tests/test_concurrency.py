@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Stress test of MovieDatabase: writer threads (add, update, delete,
+    batch) hammer the catalog while reader threads search, query, page
+    and iterate it
+"""
+import random
+import threading
+import pytest
+from benchmarks.synthetic import GENRES, TITLE_WORDS, generate_movie, write_catalog
+from conftest import indexes_match
+from database import MovieDatabase
+from line_snapshot import LazyMovies
+
+WRITERS = 8
+READERS = 6
+WRITES_PER_THREAD = 150
+CATALOG_SIZE = 2000
+
+
+def writer(db: MovieDatabase, seed: int, created: list, errors: list) -> None:
+    rng = random.Random(seed)
+    try:
+        for i in range(WRITES_PER_THREAD):
+            movie_id = rng.randint(1, db.next_id - 1)
+            op = rng.random()
+            if op < 0.4:
+                created.append(db.add_movie(generate_movie(rng))["id"])
+            elif op < 0.7:
+                db.update_movie(movie_id, {"rating": round(rng.uniform(1, 10), 1), "title": rng.choice(TITLE_WORDS)})
+            elif op < 0.8:
+                db.delete_movie(movie_id)
+            elif op < 0.9:
+                db.update_movies({"price": round(rng.uniform(1, 20), 2)}, ids=rng.sample(range(1, db.next_id), 20),
+                                 key=f"{seed}-{i}")
+            else:
+                db.delete_movies(ids=rng.sample(range(1, db.next_id), 5), genre=rng.choice(GENRES))
+    except Exception as e:
+        errors.append(e)
+
+
+def reader(db: MovieDatabase, seed: int, stop: threading.Event, errors: list) -> None:
+    rng = random.Random(seed)
+    try:
+        while not stop.is_set():
+            word = rng.choice(TITLE_WORDS).lower()
+            db.search_movies(word)
+            db.search_movies(word[:-1] + "x", fuzzy=True)
+            db.query_movies(sort="-rating", limit=20, genre=rng.choice(GENRES), rating_min=5)
+            page, last_key = db.find_movies(sort="title", limit=50)
+            if last_key is not None:
+                db.find_movies(sort="title", limit=50, after=last_key)
+            db.search_page(word, sort="-year", limit=10)
+            db.catalog_stats("genre")
+            ids = [movie["id"] for movie in db.iter_movies()]
+            assert ids == sorted(set(ids))
+    except Exception as e:
+        errors.append(e)
+
+
+@pytest.mark.parametrize("snapshot_format", ["json", "lines"])
+def test_concurrent_writes_and_reads(tmp_path, snapshot_format):
+    path = write_catalog(tmp_path / "movies.json", CATALOG_SIZE)
+    if snapshot_format == "lines":
+        # rewritten as a lines snapshot, loaded lazily below
+        converter = MovieDatabase(file_path=path, snapshot_format="lines")
+        converter.compact()
+        converter.close()
+    db = MovieDatabase(file_path=path, compact_threshold=200, snapshot_format=snapshot_format)
+    created, errors, stop = [], [], threading.Event()
+    readers = [threading.Thread(target=reader, args=(db, 100 + n, stop, errors)) for n in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(db, n, created, errors)) for n in range(WRITERS)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert errors == []
+    assert len(created) == len(set(created))
+    assert max(created) < db.next_id
+    live = {movie["id"]: movie for movie in db.iter_movies()}
+    assert indexes_match(db)
+    next_id = db.next_id
+    if snapshot_format == "lines":
+        # compactions reopen the movies on the new snapshot, dropping the overlays
+        db.compact()
+        assert isinstance(db.movies, LazyMovies) and not db.movies.changes()[0] and not db.movies.changes()[1]
+        assert {movie["id"]: movie for movie in db.iter_movies()} == live
+    db.close()
+    reloaded = MovieDatabase(file_path=path, snapshot_format=snapshot_format)
+    try:
+        assert {movie["id"]: movie for movie in reloaded.iter_movies()} == live
+        assert reloaded.next_id == next_id
+    finally:
+        reloaded.close()
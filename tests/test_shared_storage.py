@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Shared storage tests: several processes share one catalog
+    (shared=True, frequent compactions) and write to it concurrently,
+    afterwards every process must hold exactly what a fresh load reads;
+    a refresh during the background index build must not index twice
+"""
+import multiprocessing
+import random
+import threading
+import time
+import pytest
+from benchmarks.synthetic import GENRES, TITLE_WORDS, generate_movie, write_catalog
+from conftest import indexes_match
+from database import MovieDatabase
+from line_snapshot import LazyMovies
+from process_lock import fcntl
+
+# shared=True serializes the processes with flock
+pytestmark = pytest.mark.skipif(fcntl is None, reason="sharing the catalog needs fcntl (POSIX only)")
+
+WORKERS = 4
+WRITES_PER_WORKER = 60
+CATALOG_SIZE = 300
+COMPACT_THRESHOLD = 10
+
+
+def worker(path: str, seed: int, barrier, results) -> None:
+    rng = random.Random(seed)
+    db = MovieDatabase(file_path=path, shared=True, compact_threshold=COMPACT_THRESHOLD)
+    created, error = [], None
+    try:
+        barrier.wait()
+        for i in range(WRITES_PER_WORKER):
+            movie_id = rng.randint(1, db.next_id - 1)
+            op = rng.random()
+            if op < 0.4:
+                created.append(db.add_movie(generate_movie(rng))["id"])
+            elif op < 0.7:
+                db.update_movie(movie_id, {"rating": round(rng.uniform(1, 10), 1), "title": rng.choice(TITLE_WORDS)})
+            elif op < 0.8:
+                db.delete_movie(movie_id)
+            elif op < 0.9:
+                db.update_movies({"price": round(rng.uniform(1, 20), 2)}, ids=rng.sample(range(1, db.next_id), 10),
+                                 key=f"{seed}-{i}")
+            else:
+                db.delete_movies(ids=rng.sample(range(1, db.next_id), 3), genre=rng.choice(GENRES))
+    except Exception as e:
+        error = repr(e)
+    # every worker is done writing before the others compare
+    barrier.wait()
+    db.refresh()
+    results.put({"seed": seed, "error": error, "created": created, "next_id": db.next_id,
+                 "movies": {movie["id"]: movie for movie in db.iter_movies()}, "indexes_match": indexes_match(db)})
+    db.close()
+
+
+def test_workers_converge_on_the_shared_files(tmp_path):
+    path = str(write_catalog(tmp_path / "movies.json", CATALOG_SIZE))
+    context = multiprocessing.get_context("spawn")
+    barrier, results = context.Barrier(WORKERS), context.Queue()
+    processes = [context.Process(target=worker, args=(path, seed, barrier, results)) for seed in range(WORKERS)]
+    for process in processes:
+        process.start()
+    reports = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+    fresh = MovieDatabase(file_path=path, shared=True)
+    try:
+        expected = {movie["id"]: movie for movie in fresh.iter_movies()}
+        for report in reports:
+            assert report["error"] is None, report["error"]
+            assert report["movies"] == expected
+            assert report["next_id"] == fresh.next_id
+            assert report["indexes_match"]
+        created = [movie_id for report in reports for movie_id in report["created"]]
+        assert len(created) == len(set(created))
+        assert indexes_match(fresh)
+    finally:
+        fresh.close()
+
+
+def test_refresh_waits_for_the_background_index_build(tmp_path, monkeypatch):
+    path = write_catalog(tmp_path / "movies.json", CATALOG_SIZE)
+    rng = random.Random(1)
+    other = MovieDatabase(file_path=path, shared=True, snapshot_format="lines")
+    other.compact()
+    # a stale indexes sidecar is rebuilt from the movies in the background
+    (tmp_path / "movies.json.idx").unlink(missing_ok=True)
+    building, resume = threading.Event(), threading.Event()
+    values = LazyMovies.values
+
+    def paused_values(movies):
+        # only the first scan, the build of the indexes, is held
+        if not building.is_set():
+            building.set()
+            resume.wait(10)
+        return values(movies)
+
+    monkeypatch.setattr(LazyMovies, "values", paused_values)
+    db = MovieDatabase(file_path=path, shared=True, snapshot_format="lines")
+    try:
+        assert building.wait(10)
+        for _ in range(20):
+            other.add_movie(generate_movie(rng))
+        other.update_movie(1, {"rating": 9.9})
+        other.delete_movie(2)
+        refresh = threading.Thread(target=db.refresh)
+        refresh.start()
+        # lets refresh apply the records before the build scans the movies if it does not wait
+        time.sleep(0.2)
+        resume.set()
+        refresh.join(10)
+        monkeypatch.undo()
+        assert {movie["id"]: movie for movie in db.iter_movies()} == {movie["id"]: movie for movie in other.iter_movies()}
+        assert indexes_match(db)
+    finally:
+        resume.set()
+        db.close()
+        other.close()